@@ -1,3 +1,14 @@
 """
 This file is a configuration file for pytest, and also tells pytest where the source code is. Do not remove this file.
 """
+import os
+import sys
+
+# Tests run on the host, with the hardware simulated by tools/hostsim. The display driver is shared with the pager
+# node, at the top of the repository.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import hostsim  # noqa: E402
+
+hostsim.install()
@@ -5,41 +5,84 @@
 #
 # Licensed under the MIT license, see LICENSE.txt for details
 import gc
+import time
 from machine import SoftI2C, Pin
 from ssd1306 import SSD1306_I2C
 
+try:
+    import ujson as json
+except ImportError:
+    import json
+
 try:
     import uasyncio as asyncio
 except ImportError:
     import asyncio
 
-from dawndoor import data
-from dawndoor.astro import calculate_sunrise_sunset
+from dawndoor import data, journal
+from dawndoor.astro import calculate_sun_table
 from dawndoor.datetime import DateTime, tz_to_offset
 from dawndoor.door import DoorStatus, open_door, close_door
 from dawndoor.image import load_pbm
 from dawndoor.state import State
-from dawndoor.web import WebApp, jsonify
+from dawndoor.web import EventStream, WebApp, http_error, jsonify, start_response
 from dawndoor.wifi import connect, get_ip, get_ap_ip, start_ap, stop_ap, is_connected
 
-webapp = WebApp()
+# The only headers that the form handlers need
+FORM_HEADERS = (b'Content-Length', b'Content-Type')
+# How often to check whether the WiFi connection has come up or gone down, in seconds
+CONNECTION_CHECK_INTERVAL = 5
+
+webapp = WebApp(keep_alive=True, max_connections=4)
+events = EventStream(max_subscribers=2)
+webapp.add_url_rule('/events', events.handle, method='GET', headers='skip')
 state = State(
     is_ready=False,
     is_display_updated=False,
-    is_time_set=False
+    is_time_set=False,
+    is_connected=False,
+    door_schedule=0
 )
+# Held while the door is moving, so that two moves never run the motor both ways at once
+door_lock = asyncio.Lock()
+# The serialized response for /status, and what it was built from
+_status_cache = {
+    'key': None,
+    'status': None,
+    'body': None
+}
 
 
-@webapp.route('/', method='GET')
+@webapp.route('/', method='GET', headers='skip')
 def index(request, response):
     """
-    The main page
+    The main page. The dashboard is filled in on the server, and the data for the rest of the page is included in it,
+    so that the page doesn't have to ask for it.
     """
+    status, body = load_status()
+    # The status is in a <script> element, which a "</" in one of the values would end
+    status_json = body.replace(b'</', b'<\\/')
+    network = status['network']
+    location = status['location'] or {}
+    door_status = status['door']['status']
+    sun = status['sun'] or {}
     gc.collect()
-    yield from webapp.sendfile(response, '/templates/index.html')
+    yield from webapp.render_template(response, 'index.html', {
+        'status': lambda writer: writer.awrite(status_json),
+        'door_status': door_status,
+        'invert_action': 'Open' if door_status == DoorStatus.Closed else 'Close',
+        'connection': 'Connected' if network.get('connected') else 'Not connected',
+        'ip_address': network.get('ip_address'),
+        'essid': network.get('essid', ''),
+        'can_start_ap': 'checked' if network.get('can_start_ap', True) else '',
+        'latitude': location.get('latitude', ''),
+        'longitude': location.get('longitude', ''),
+        'sunrise': sun.get('sunrise', '(unknown)'),
+        'sunset': sun.get('sunset', '(unknown)')
+    })
 
 
-@webapp.route('/location', method='GET')
+@webapp.route('/location', method='GET', headers='skip')
 def get_location(request, response):
     """
     Get the location and timezone
@@ -49,7 +92,7 @@ def get_location(request, response):
     yield from jsonify(response, location_data)
 
 
-@webapp.route('/location', method='POST')
+@webapp.route('/location', method='POST', headers=FORM_HEADERS)
 def save_location(request, response):
     """
     Save the location and timezone
@@ -61,11 +104,12 @@ def save_location(request, response):
         'timezone': request.form['timezone']
     }
     data.save_location(**updated_data)
+    update_sun_table()
     gc.collect()
     yield from jsonify(response, request.form)
 
 
-@webapp.route('/network', method='GET')
+@webapp.route('/network', method='GET', headers='skip')
 def get_network(request, response):
     """
     Return the WiFi config
@@ -76,7 +120,7 @@ def get_network(request, response):
     yield from jsonify(response, network_config)
 
 
-@webapp.route('/network', method='POST')
+@webapp.route('/network', method='POST', headers=FORM_HEADERS)
 def save_network(request, response):
     """
     Save the network config
@@ -86,13 +130,16 @@ def save_network(request, response):
     for key in ['essid', 'password', 'can_start_ap']:
         if key in request.form:
             updated_config[key] = request.form[key]
+    if 'can_start_ap' in updated_config and not isinstance(updated_config['can_start_ap'], bool):
+        # JSON bodies send a boolean, form bodies send a string
+        updated_config['can_start_ap'] = str(updated_config['can_start_ap']).lower() == 'true'
     data.save_network(**updated_config)
     gc.collect()
     # Now try to connect to the WiFi network
     connect()
+    check_connection()
     gc.collect()
     if 'can_start_ap' in updated_config:
-        updated_config['can_start_ap'] = updated_config['can_start_ap'].lower() == 'true'
         if updated_config['can_start_ap'] is False:
             stop_ap()
         else:
@@ -102,7 +149,7 @@ def save_network(request, response):
     yield from jsonify(response, updated_config)
 
 
-@webapp.route('/door', method='GET')
+@webapp.route('/door', method='GET', headers='skip')
 def get_door_config(request, response):
     """
     Return the door status
@@ -113,19 +160,27 @@ def get_door_config(request, response):
     yield from jsonify(response, door_data)
 
 
-@webapp.route('/door', method='POST')
+@webapp.route('/door', method='POST', headers=FORM_HEADERS)
 def save_door_config(request, response):
     """
     Save the door config or status
     """
     yield from request.read_form_data()
-    if request.form.get('action'):
-        if request.form['action'] == 'open':
-            open_door()
-        elif request.form['action'] == 'close':
-            close_door()
+    if door_lock.locked() and ('action' in request.form or 'status' in request.form):
+        # The door is already moving
+        yield from http_error(response, '409')
+        return
+    if request.form.get('action') in ('open', 'close'):
+        # Moving the door takes a while, so do it in the background
+        asyncio.get_event_loop().create_task(move_door(request.form['action'], 'api'))
     elif 'status' in request.form:
+        if request.form['status'] not in (DoorStatus.Open, DoorStatus.Closed):
+            yield from http_error(response, '400')
+            return
         data.save_door_status(request.form['status'])
+        # The door was moved by hand, and this is what it is now
+        journal.append('open' if request.form['status'] == DoorStatus.Open else 'close', 'manual')
+        door_changed()
     gc.collect()
     updated_config = data.get_door_config()
     for key in ['duration']:
@@ -138,73 +193,250 @@ def save_door_config(request, response):
     yield from jsonify(response, updated_config)
 
 
+@webapp.route('/journal', method='GET', headers='skip')
+def get_journal(request, response):
+    """
+    Return a page of the door journal, newest first. Pass the ``next`` value from a page as ``before`` to get the
+    next page.
+    """
+    request.parse_qs()
+    try:
+        before = int(request.form['before']) if 'before' in request.form else None
+        limit = max(1, min(int(request.form.get('limit', journal.PAGE_SIZE)), 50))
+    except ValueError:
+        yield from http_error(response, '400')
+        return
+    entries = journal.read_page(before, limit)
+    yield from jsonify(response, {
+        'entries': (format_journal_entry(entry) for entry in entries),
+        'next': entries[-1][0] if entries and len(entries) == limit and entries[-1][0] > 1 else None
+    })
+
+
+def format_journal_entry(entry):
+    """
+    Turn a journal entry into a dict for the web UI
+    """
+    seq, timestamp, action, trigger, duration = entry
+    return {
+        'seq': seq,
+        'time': '{:0>4}-{:0>2}-{:0>2}T{:0>2}:{:0>2}:{:0>2}Z'.format(*time.gmtime(timestamp)[:6]),
+        'action': action,
+        'trigger': trigger,
+        'duration': duration
+    }
+
+
+def format_sun(sun_data):
+    """
+    Format the sunrise and sunset for the web UI
+    """
+    if not sun_data:
+        return None
+    return {
+        'sunrise': '{:0>2}:{:0>2}'.format(sun_data[0].hour, sun_data[0].minute),
+        'sunset': '{:0>2}:{:0>2}'.format(sun_data[1].hour, sun_data[1].minute)
+    }
+
+
+def build_status(location, ip, now):
+    """
+    Put together the location, network, door and today's sunrise and sunset, for the dashboard
+    """
+    network_config = data.get_network() or {}
+    network_config['ip_address'] = ip
+    network_config['connected'] = ip is not None
+    door_data = data.get_door_config() or {'duration': 0}
+    door_data['status'] = data.get_door_status() or '(unknown)'
+    return {
+        'location': location,
+        'network': network_config,
+        'door': door_data,
+        'sun': format_sun(data.get_sunrise_sunset(now) if now else None)
+    }
+
+
+def load_status():
+    """
+    Return the /status data and its JSON. They are only built again when the data, the connection or the day has
+    changed.
+    """
+    location = data.get_location()
+    ip = get_ip()
+    now = DateTime.now().as_timezone(location['timezone']) if location and state.get('is_time_set') else None
+    key = (data.get_version(), ip, now.doy if now else None)
+    if _status_cache['key'] != key:
+        _status_cache['status'] = build_status(location, ip, now)
+        _status_cache['body'] = json.dumps(_status_cache['status']).encode()
+        _status_cache['key'] = key
+    return _status_cache['status'], _status_cache['body']
+
+
+@webapp.route('/status', method='GET', headers='skip')
+def get_status(request, response):
+    """
+    Return everything the dashboard needs in one response
+    """
+    status, body = load_status()
+    yield from start_response(response, 'application/json', headers={'Content-Length': str(len(body))})
+    yield from response.awrite(body)
+
+
+def door_changed():
+    """
+    Let the display and any connected browsers know that the door has moved
+    """
+    state.set('is_display_updated', True)
+    events.publish('door', {'status': data.get_door_status()})
+
+
+async def move_door(action, trigger):
+    """
+    Open or close the door, and record it in the journal
+
+    :param action: 'open' or 'close'
+    :param trigger: What moved the door: 'schedule' or 'api'
+    """
+    async with door_lock:
+        if trigger == 'schedule' and data.get_door_status() == (DoorStatus.Open if action == 'open' else
+                                                                DoorStatus.Closed):
+            # The door was moved another way while this move was waiting for the last one to finish
+            return
+        start = time.ticks_ms()
+        if action == 'open':
+            await open_door()
+        else:
+            await close_door()
+        journal.append(action, trigger, (time.ticks_diff(time.ticks_ms(), start) + 500) // 1000)
+    door_changed()
+
+
+def check_connection():
+    """
+    If the WiFi connection has come up or gone down, let the display and any connected browsers know
+    """
+    connected = is_connected()
+    if connected == state.get('is_connected'):
+        return
+    state.set('is_connected', connected)
+    state.set('is_display_updated', True)
+    events.publish('network', {'connected': connected, 'ip_address': get_ip()})
+
+
+async def watch_connection():
+    """
+    Keep an eye on the WiFi connection. MicroPython has no callback for it coming up or going down, so check it every
+    few seconds.
+    """
+    while True:
+        check_connection()
+        await asyncio.sleep(CONNECTION_CHECK_INTERVAL)
+
+
 async def set_time():
     """
     Set the time from NTP
     """
     while True:
-        if is_connected():
-            from ntptime import settime
-            settime()
-            state.set('is_time_set', True)
-            state.set('is_display_updated', True)
-            print('Time set')
-            gc.collect()
-            await asyncio.sleep(3600)
-        else:
-            # If there's no connection, let's try again in a second
-            print('No connection, retrying set_time in 1s')
-            await asyncio.sleep(1)
+        # Wait for the connection to come up, rather than polling for it
+        await state.wait_for('is_connected')
+        from ntptime import settime
+        settime()
+        state.set('is_time_set', True)
+        state.set('is_display_updated', True)
+        print('Time set')
+        gc.collect()
+        await asyncio.sleep(3600)
+
+
+def update_sun_table():
+    """
+    Generate the sunrise and sunset table for the year, if there is a location and the table doesn't exist yet
+    """
+    location = data.get_location()
+    if not location or data.has_sun_table():
+        return
+    print('Calculating sunrise and sunset table')
+    data.save_sun_table(calculate_sun_table(location['latitude'], location['longitude'],
+                                            tz_to_offset(location['timezone'])))
+    state.set('is_display_updated', True)
+    reschedule_door()
+    if state.get('is_time_set'):
+        now = DateTime.now().as_timezone(location['timezone'])
+        events.publish('sun', format_sun(data.get_sunrise_sunset(now)))
 
 
 async def calc_sunrise_sunset():
     """
-    Periodically check if there's a sunrise/sunset file with the current date, and if not then generate it.
+    Periodically check if there's a sunrise/sunset table, and if not then generate it.
     """
     while True:
-        if not state.get('is_time_set'):
-            print('Time not set yet, retrying calc_sunrise_sunset in 5s')
-            await asyncio.sleep(5)
-            continue
-        location = data.get_location()
-        now = DateTime.now().as_timezone(location['timezone'])
-        sun_data = data.get_sunrise_sunset(now)
-        if location and not sun_data:
-            print('Calculating sunrise and sunset')
-            sunrise, sunset = calculate_sunrise_sunset(now, location['latitude'], location['longitude'],
-                                                       tz_to_offset(location['timezone']))
-            data.save_sunrise_sunset(sunrise, sunset)
-            state.set('is_display_updated', True)
+        update_sun_table()
         gc.collect()
         await asyncio.sleep(3600)
 
 
+def reschedule_door():
+    """
+    Wake up door_check to work out when the door should next move, e.g. when the sunrise and sunset times change
+    """
+    state.set('door_schedule', state.get('door_schedule') + 1)
+
+
+def next_door_move(now, sun_data):
+    """
+    Return the number of seconds until the next sunrise or sunset. After sunset that is tomorrow's sunrise. If the sun
+    doesn't rise tomorrow, check again in an hour.
+    """
+    sunrise, sunset = sun_data
+    if now < sunrise:
+        return sunrise.unixtime() - now.unixtime()
+    if now < sunset:
+        return sunset.unixtime() - now.unixtime()
+    tomorrow = DateTime.from_timestamp(now.unixtime() + 86400)
+    sun_data = data.get_sunrise_sunset(tomorrow)
+    if not sun_data:
+        return 3600
+    return sun_data[0].unixtime() - now.unixtime()
+
+
 async def door_check():
     """
-    Check the time and either open or close the coop door
+    Open the coop door at sunrise and close it at sunset. In between, sleep until the next sunrise or sunset, or until
+    the door is rescheduled.
     """
     while True:
-        if not state.get('is_time_set'):
-            print('Time not set yet, retrying door_check in 5s')
-            await asyncio.sleep(5)
-            continue
+        await state.wait_for('is_time_set')
         location = data.get_location()
-        now = DateTime.now().as_timezone(location['timezone'])
-        sun_data = data.get_sunrise_sunset(now)
-        door_status = data.get_door_status()
-        if sun_data:
-            print('Checking door')
-            sunrise = DateTime(**sun_data['sunrise'])
-            sunset = DateTime(**sun_data['sunset'])
-            if door_status == DoorStatus.Closed and now > sunrise and now < sunset:
-                print('Opening door')
-                await open_door()
-            elif door_status == DoorStatus.Open and now > sunset:
-                print('Closing door')
-                await close_door()
-            state.set('is_display_updated', True)
+        delay = None
+        if location:
+            now = DateTime.now().as_timezone(location['timezone'])
+            sun_data = data.get_sunrise_sunset(now)
+            if sun_data:
+                print('Checking door')
+                sunrise, sunset = sun_data
+                door_status = data.get_door_status()
+                if door_status == DoorStatus.Closed and now > sunrise and now < sunset:
+                    print('Opening door')
+                    await move_door('open', 'schedule')
+                    now = DateTime.now().as_timezone(location['timezone'])
+                elif door_status == DoorStatus.Open and now > sunset:
+                    print('Closing door')
+                    await move_door('close', 'schedule')
+                    now = DateTime.now().as_timezone(location['timezone'])
+                delay = next_door_move(now, sun_data)
+            else:
+                # The table for the new location is still being generated, or the sun doesn't rise or set today
+                delay = 3600
         gc.collect()
-        await asyncio.sleep(300)
+        try:
+            if delay is None:
+                await state.changed('door_schedule')
+            else:
+                # Sleep a second past the sunrise or sunset, because the door only moves after it
+                await asyncio.wait_for(state.changed('door_schedule'), delay + 1)
+        except asyncio.TimeoutError:
+            pass
 
 
 async def display_time():
@@ -215,10 +447,9 @@ async def display_time():
     display.fill(0)
     display.blit(splash_logo, 31, 0)
     display.show()
+    await state.wait_for('is_display_updated')
     while True:
-        if not state.get('is_display_updated'):
-            await asyncio.sleep(1)
-            continue
+        state.set('is_display_updated', False)
         display.fill(0)
         if not data.has_config():
             ip = get_ap_ip()
@@ -233,21 +464,24 @@ async def display_time():
             now = DateTime.now().as_timezone(location_data['timezone'])
             sun_data = data.get_sunrise_sunset(now)
             display.text('DawnDoor', 0, 0)
-            if is_connected():
+            if ip:
                 display.text('Connected', 0, 16)
                 display.text(ip, 0, 26)
             else:
                 display.text('Not connected', 0, 16)
             if sun_data:
-                sunrise = DateTime(**sun_data['sunrise'])
-                sunset = DateTime(**sun_data['sunset'])
+                sunrise, sunset = sun_data
                 display.text('{:0>2}:{:0>2}'.format(sunrise.hour, sunrise.minute), 0, 46)
                 display.text('{:0>2}:{:0>2}'.format(sunset.hour, sunset.minute), 88, 46)
             display.text(door_status, 0, 56)
             display.text('{:0>2}:{:0>2}'.format(now.hour, now.minute), 88, 56)
         display.show()
         gc.collect()
-        await asyncio.sleep(1)
+        # Sleep until the clock needs to change, or until something else on the display does
+        try:
+            await asyncio.wait_for(state.changed('is_display_updated'), 60 - time.localtime()[5])
+        except asyncio.TimeoutError:
+            pass
 
 
 def main():
@@ -256,10 +490,15 @@ def main():
     """
     connect()
     loop = asyncio.get_event_loop()
+    loop.create_task(watch_connection())
     loop.create_task(display_time())
     loop.create_task(set_time())
     loop.create_task(calc_sunrise_sunset())
     loop.create_task(door_check())
+    loop.create_task(data.persist())
     loop.create_task(asyncio.start_server(webapp.handle, '0.0.0.0', 80))
     gc.collect()
-    loop.run_forever()
+    try:
+        loop.run_forever()
+    finally:
+        data.flush()
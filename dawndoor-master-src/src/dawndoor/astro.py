@@ -6,17 +6,19 @@ with MicroPython (and it's lack of CPython objects)
 This module calculates the times of sunrise and sunset given a location and date.
 """
 import math
+import struct
 from dawndoor.datetime import DateTime
 
 CIVIL_ZENITH = 90.83333
+COS_ZENITH = math.cos(math.radians(CIVIL_ZENITH))
+DAYS_IN_YEAR = 366
+NO_SUN = 0xffff
 
 
-def calculate_sunrise_sunset(date, latitude, longitude, timezone=0):
+def _clamp(latitude, longitude, timezone):
     """
-    Computes the sunset and sunrise for the current day, in local time
+    Keep the latitude, longitude and timezone within their valid ranges
     """
-    if not date:
-        date = DateTime.now()
     if latitude < -90:
         latitude = -90
     if latitude > 90:
@@ -29,74 +31,76 @@ def calculate_sunrise_sunset(date, latitude, longitude, timezone=0):
         timezone = -12
     if timezone > 14:
         timezone = 14
+    return latitude, longitude, timezone
 
-    # Calculate the day of the year
-    day_of_year = date.doy
 
-    # Convert the longitude to hour value and calculate an approximate time
-    longitude_hour = longitude / 15
-    approx_rise = day_of_year + ((6 - longitude_hour) / 24)
-    approx_set = day_of_year + ((18 - longitude_hour) / 24)
+def _event_time(day_of_year, is_rise, longitude_hour, sin_latitude, cos_latitude, timezone):
+    """
+    Computes the time of sunrise or sunset on a day of the year, in fractional hours of local time. Raises a
+    ValueError if the sun does not rise or set on that day.
+    """
+    # Calculate an approximate time
+    approx = day_of_year + (((6 if is_rise else 18) - longitude_hour) / 24)
 
     # Calculate the Sun's mean anomaly
-    mean_rise = (0.9856 * approx_rise) - 3.289
-    mean_set = (0.9856 * approx_set) - 3.289
+    mean = (0.9856 * approx) - 3.289
 
     # Calculate the Sun's true longitude, and adjust angle to be between 0
     # and 360
-    long_rise = (mean_rise + (1.916 * math.sin(math.radians(mean_rise))) +
-                 (0.020 * math.sin(math.radians(2 * mean_rise))) + 282.634) % 360
-    long_set = (mean_set + (1.916 * math.sin(math.radians(mean_set))) +
-                (0.020 * math.sin(math.radians(2 * mean_set))) + 282.634) % 360
+    true_long = (mean + (1.916 * math.sin(math.radians(mean))) +
+                 (0.020 * math.sin(math.radians(2 * mean))) + 282.634) % 360
 
     # Calculate the Sun's right ascension, and adjust angle to be between 0 and
     # 360
-    right_ascension_rise = (math.degrees(math.atan(0.91764 * math.tan(math.radians(long_rise))))) % 360
-    right_ascension_set = (math.degrees(math.atan(0.91764 * math.tan(math.radians(long_set))))) % 360
+    right_ascension = (math.degrees(math.atan(0.91764 * math.tan(math.radians(true_long))))) % 360
 
     # Right ascension value needs to be in the same quadrant as L
-    long_quadrant_rise = (math.floor(long_rise/90)) * 90
-    right_ascension_quadrant_rise = (math.floor(right_ascension_rise/90)) * 90
-    right_ascension_rise = right_ascension_rise + (long_quadrant_rise - right_ascension_quadrant_rise)
-
-    long_quadrant_set = (math.floor(long_set/90)) * 90
-    right_ascension_quadrant_set = (math.floor(right_ascension_set/90)) * 90
-    right_ascension_set = right_ascension_set + (long_quadrant_set - right_ascension_quadrant_set)
+    long_quadrant = (math.floor(true_long/90)) * 90
+    right_ascension_quadrant = (math.floor(right_ascension/90)) * 90
+    right_ascension = right_ascension + (long_quadrant - right_ascension_quadrant)
 
     # Right ascension value needs to be converted into hours
-    right_ascension_rise = right_ascension_rise / 15
-    right_ascension_set = right_ascension_set / 15
+    right_ascension = right_ascension / 15
 
     # Calculate the Sun's declination
-    sin_declination_rise = 0.39782 * math.sin(math.radians(long_rise))
-    cos_declination_rise = math.cos(math.asin(sin_declination_rise))
-
-    sin_declination_set = 0.39782 * math.sin(math.radians(long_set))
-    cos_declination_set = math.cos(math.asin(sin_declination_set))
+    sin_declination = 0.39782 * math.sin(math.radians(true_long))
+    cos_declination = math.cos(math.asin(sin_declination))
 
     # Calculate the Sun's local hour angle
-    cos_zenith = math.cos(math.radians(CIVIL_ZENITH))
-    radian_lat = math.radians(latitude)
-    sin_latitude = math.sin(radian_lat)
-    cos_latitude = math.cos(radian_lat)
-    cos_hour_angle_rise = (cos_zenith - (sin_declination_rise * sin_latitude)) / (cos_declination_rise * cos_latitude)
-    cos_hour_angle_set = (cos_zenith - (sin_declination_set * sin_latitude)) / (cos_declination_set * cos_latitude)
+    cos_hour_angle = (COS_ZENITH - (sin_declination * sin_latitude)) / (cos_declination * cos_latitude)
 
     # Finish calculating H and convert into hours
-    hour_angle_rise = (360 - math.degrees(math.acos(cos_hour_angle_rise))) / 15
-    hour_angle_set = math.degrees(math.acos(cos_hour_angle_set)) / 15
+    if is_rise:
+        hour_angle = (360 - math.degrees(math.acos(cos_hour_angle))) / 15
+    else:
+        hour_angle = math.degrees(math.acos(cos_hour_angle)) / 15
 
     # Calculate local mean time of rising/setting
-    mean_time_rise = hour_angle_rise + right_ascension_rise - (0.06571 * approx_rise) - 6.622
-    mean_time_set = hour_angle_set + right_ascension_set - (0.06571 * approx_set) - 6.622
+    mean_time = hour_angle + right_ascension - (0.06571 * approx) - 6.622
 
     # Adjust back to UTC, and keep the time between 0 and 24
-    utc_rise = (mean_time_rise - longitude_hour) % 24
-    utc_set = (mean_time_set - longitude_hour) % 24
+    utc_time = (mean_time - longitude_hour) % 24
 
     # Convert UT value to local time zone of latitude/longitude
-    local_time_rise = (utc_rise + timezone) % 24
-    local_time_set = (utc_set + timezone) % 24
+    return (utc_time + timezone) % 24
+
+
+def calculate_sunrise_sunset(date, latitude, longitude, timezone=0):
+    """
+    Computes the sunset and sunrise for the current day, in local time
+    """
+    if not date:
+        date = DateTime.now()
+    latitude, longitude, timezone = _clamp(latitude, longitude, timezone)
+
+    # Convert the longitude to hour value
+    longitude_hour = longitude / 15
+    radian_lat = math.radians(latitude)
+    sin_latitude = math.sin(radian_lat)
+    cos_latitude = math.cos(radian_lat)
+
+    local_time_rise = _event_time(date.doy, True, longitude_hour, sin_latitude, cos_latitude, timezone)
+    local_time_set = _event_time(date.doy, False, longitude_hour, sin_latitude, cos_latitude, timezone)
 
     # Conversion
     hour_rise = int(local_time_rise)
@@ -111,4 +115,125 @@ def calculate_sunrise_sunset(date, latitude, longitude, timezone=0):
     return rise_dt, set_dt
 
 
-__all__ = ['calculate_sunrise_sunset']
+def _sun_minutes(day_of_year, longitude_hour, sin_latitude, cos_latitude, timezone):
+    """
+    Computes the sunrise and sunset on a day of the year as minutes of the day in local time, with NO_SUN if the sun
+    does not rise or set
+    """
+    minutes = [NO_SUN, NO_SUN]
+    for index, is_rise in ((0, True), (1, False)):
+        try:
+            local_time = _event_time(day_of_year, is_rise, longitude_hour, sin_latitude, cos_latitude, timezone)
+        except ValueError:
+            continue
+        minutes[index] = int(local_time) * 60 + int(local_time % 1 * 60)
+    return minutes
+
+
+def calculate_sun_table(latitude, longitude, timezone=0):
+    """
+    Computes the sunrise and sunset for every day of the year in one pass, in local time. The table is packed as pairs
+    of little-endian unsigned shorts holding the minute of the day, indexed by the day of the year (starting from 1).
+    Days on which the sun does not rise or set are marked with NO_SUN.
+    """
+    latitude, longitude, timezone = _clamp(latitude, longitude, timezone)
+    longitude_hour = longitude / 15
+    radian_lat = math.radians(latitude)
+    sin_latitude = math.sin(radian_lat)
+    cos_latitude = math.cos(radian_lat)
+    table = bytearray(DAYS_IN_YEAR * 4)
+    for day_of_year in range(1, DAYS_IN_YEAR + 1):
+        sunrise, sunset = _sun_minutes(day_of_year, longitude_hour, sin_latitude, cos_latitude, timezone)
+        struct.pack_into('<HH', table, (day_of_year - 1) * 4, sunrise, sunset)
+    return table
+
+
+def _day_of_year(date):
+    """
+    Return the day of the year of a Date object, or the value itself if it is already a day of the year
+    """
+    return getattr(date, 'doy', date)
+
+
+def _calculate_sun_times_scalar(dates, latitudes, longitudes, timezones):
+    """
+    Computes the sunrise and sunset for each entry in turn, repeating any scalar arguments
+    """
+    args = [dates, latitudes, longitudes, timezones]
+    size = 1
+    for arg in args:
+        if isinstance(arg, (list, tuple)):
+            size = max(size, len(arg))
+    for index, arg in enumerate(args):
+        if not isinstance(arg, (list, tuple)):
+            args[index] = [arg] * size
+    sunrises = []
+    sunsets = []
+    for date, latitude, longitude, timezone in zip(*args):
+        latitude, longitude, timezone = _clamp(latitude, longitude, timezone)
+        radian_lat = math.radians(latitude)
+        sunrise, sunset = _sun_minutes(_day_of_year(date), longitude / 15, math.sin(radian_lat),
+                                       math.cos(radian_lat), timezone)
+        sunrises.append(sunrise)
+        sunsets.append(sunset)
+    return sunrises, sunsets
+
+
+def _event_minutes_numpy(np, day_of_year, is_rise, longitude_hour, sin_latitude, cos_latitude, timezone):
+    """
+    A vectorised version of ``_event_time``, which returns minutes of the day with NO_SUN where there is no event
+    """
+    approx = day_of_year + (((6 if is_rise else 18) - longitude_hour) / 24)
+    mean = (0.9856 * approx) - 3.289
+    true_long = (mean + (1.916 * np.sin(np.radians(mean))) +
+                 (0.020 * np.sin(np.radians(2 * mean))) + 282.634) % 360
+    right_ascension = (np.degrees(np.arctan(0.91764 * np.tan(np.radians(true_long))))) % 360
+    long_quadrant = (np.floor(true_long / 90)) * 90
+    right_ascension_quadrant = (np.floor(right_ascension / 90)) * 90
+    right_ascension = right_ascension + (long_quadrant - right_ascension_quadrant)
+    right_ascension = right_ascension / 15
+    sin_declination = 0.39782 * np.sin(np.radians(true_long))
+    cos_declination = np.cos(np.arcsin(sin_declination))
+    cos_hour_angle = (COS_ZENITH - (sin_declination * sin_latitude)) / (cos_declination * cos_latitude)
+    with np.errstate(invalid='ignore'):
+        if is_rise:
+            hour_angle = (360 - np.degrees(np.arccos(cos_hour_angle))) / 15
+        else:
+            hour_angle = np.degrees(np.arccos(cos_hour_angle)) / 15
+    mean_time = hour_angle + right_ascension - (0.06571 * approx) - 6.622
+    utc_time = (mean_time - longitude_hour) % 24
+    local_time = (utc_time + timezone) % 24
+    minutes = np.floor(local_time) * 60 + np.floor(local_time % 1 * 60)
+    return np.where(np.isnan(minutes), NO_SUN, minutes).astype(np.uint16)
+
+
+def calculate_sun_times(dates, latitudes, longitudes, timezones=0):
+    """
+    Computes the sunrise and sunset for many dates and locations at once, as minutes of the day in local time, with
+    NO_SUN where the sun does not rise or set. This is intended for generating schedules on a host, not on the device.
+
+    ``dates`` holds Date objects or days of the year. Arguments may be sequences, NumPy arrays or scalars. When NumPy is
+    available they are broadcast against each other (so an array of shape (sites, 1) and one of shape (days,) give a
+    (sites, days) result) and a tuple of uint16 arrays is returned. Otherwise, as on MicroPython, the sequences must
+    be the same length and each entry is calculated in turn with the same code as ``calculate_sun_table``, returning a
+    tuple of lists.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return _calculate_sun_times_scalar(dates, latitudes, longitudes, timezones)
+    if isinstance(dates, (list, tuple)):
+        dates = [_day_of_year(date) for date in dates]
+    day_of_year = np.asarray(_day_of_year(dates), dtype=float)
+    latitude = np.clip(np.asarray(latitudes, dtype=float), -90, 90)
+    longitude = np.clip(np.asarray(longitudes, dtype=float), -180, 180)
+    timezone = np.clip(np.asarray(timezones, dtype=float), -12, 14)
+    longitude_hour = longitude / 15
+    radian_lat = np.radians(latitude)
+    sin_latitude = np.sin(radian_lat)
+    cos_latitude = np.cos(radian_lat)
+    return (_event_minutes_numpy(np, day_of_year, True, longitude_hour, sin_latitude, cos_latitude, timezone),
+            _event_minutes_numpy(np, day_of_year, False, longitude_hour, sin_latitude, cos_latitude, timezone))
+
+
+__all__ = ['calculate_sunrise_sunset', 'calculate_sun_table', 'calculate_sun_times']
@@ -1,126 +1,429 @@
-import json
+import struct
+try:
+    import uos as os
+except ImportError:
+    import os
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+from dawndoor.astro import NO_SUN
+from dawndoor.datetime import DateTime
+
+DB_FILE = '/data/dawndoor.bin'
+# The database used to be JSON, and is converted the first time it is loaded
+JSON_DB_FILE = '/data/dawndoor.json'
+SUN_TABLE_FILE = '/data/sun.bin'
+SAVE_DELAY = 2
+
+# The database is a single fixed-size record, so that any field can be read straight from its offset. The format
+# version is the first byte; if the fields change, bump it and convert older records in _load_db().
+DB_FORMAT_VERSION = 1
+DB_FIELDS = (
+    ('format', 'B'),
+    ('flags', 'B'),
+    ('door_status', 'B'),
+    ('latitude', 'h'),
+    ('longitude', 'h'),
+    ('timezone', '4s'),
+    ('duration', 'H'),
+    ('essid', '32s'),
+    ('password', '64s')
+)
+# Which parts of the config have been saved, in the flags field
+HAS_LOCATION = 0x01
+HAS_NETWORK = 0x02
+HAS_DOOR_CONFIG = 0x04
+CAN_START_AP = 0x08
+# The door status is stored as an index into this tuple, with 0 meaning it hasn't been saved
+DOOR_STATUSES = (None, 'Open', 'Closed')
+
+_layout = {}
+_offset = 0
+for _name, _fmt in DB_FIELDS:
+    _layout[_name] = (_offset, '<' + _fmt)
+    _offset += struct.calcsize('<' + _fmt)
+DB_RECORD_SIZE = _offset
+
+_db = None
+_sun_entry = None
+_dirty = False
+_migrated = False
+_version = 0
+_stats = {
+    'hits': 0,
+    'misses': 0,
+    'reads': 0,
+    'writes': 0
+}
+
+
+def _new_record():
+    """
+    Return an empty record
+    """
+    record = bytearray(DB_RECORD_SIZE)
+    record[0] = DB_FORMAT_VERSION
+    return record
 
 
 def _load_db():
     """
-    Context manager to return an instance of a database
+    Return the in-memory copy of the database record, reading it from flash only if it has not been loaded yet
+    """
+    global _db
+    if _db is not None:
+        _stats['hits'] += 1
+        return _db
+    _stats['misses'] += 1
+    # If the power went out between removing the old file and renaming the new one, the temporary file is complete
+    for fname in (DB_FILE, DB_FILE + '.tmp'):
+        try:
+            with open(fname, 'rb') as f:
+                _stats['reads'] += 1
+                record = bytearray(f.read())
+        except OSError:
+            continue
+        if len(record) == DB_RECORD_SIZE and record[0] == DB_FORMAT_VERSION:
+            _db = record
+            return _db
+    _db = _new_record()
+    _migrate_json()
+    return _db
+
+
+def _migrate_network(network):
+    """
+    Convert the network config from the old database
+    """
+    network = dict(network)
+    if 'can_start_ap' in network and not isinstance(network['can_start_ap'], bool):
+        # Older versions saved the form value as it was sent, which is a string
+        network['can_start_ap'] = str(network['can_start_ap']).lower() == 'true'
+    save_network(**network)
+
+
+def _migrate_door_status(door_status):
+    """
+    Convert the door status from the old database, ignoring anything that isn't 'Open' or 'Closed'
+    """
+    if door_status in DOOR_STATUSES[1:]:
+        save_door_status(door_status)
+
+
+def _migrate_json():
+    """
+    Convert the old JSON database, if there is one. It is removed once the new database has been written. A section
+    that can't be converted is skipped, so that the rest of the config is kept.
+    """
+    global _migrated
+    try:
+        import ujson as json
+    except ImportError:
+        import json
+    try:
+        with open(JSON_DB_FILE, 'r') as f:
+            _stats['reads'] += 1
+            old_db = json.load(f)
+    except (OSError, ValueError):
+        return
+    for key, migrate in (('location', _save_location), ('network', _migrate_network),
+                         ('door_config', save_door_config), ('door_status', _migrate_door_status)):
+        if not old_db.get(key):
+            continue
+        try:
+            migrate(old_db[key])
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            print('Skipped %s from the old database: %s' % (key, e))
+    _migrated = True
+
+
+def _get(name):
+    offset, fmt = _layout[name]
+    return struct.unpack_from(fmt, _load_db(), offset)[0]
+
+
+def _set(name, value):
+    offset, fmt = _layout[name]
+    struct.pack_into(fmt, _load_db(), offset, value)
+
+
+def _get_str(name):
+    return _get(name).split(b'\0', 1)[0].decode()
+
+
+def _set_str(name, value):
+    value = (value or '').encode()
+    if len(value) > struct.calcsize(_layout[name][1]):
+        raise ValueError('%s is too long' % name)
+    _set(name, value)
+
+
+def _save_db():
+    """
+    Mark the in-memory database to be written to flash
+    """
+    global _dirty, _version
+    _dirty = True
+    _version += 1
+
+
+def read_field(name):
+    """
+    Return the raw value of a single field. If the database hasn't been loaded, only that field is read from flash.
+    """
+    if _db is None:
+        offset, fmt = _layout[name]
+        size = struct.calcsize(fmt)
+        try:
+            with open(DB_FILE, 'rb') as f:
+                _stats['reads'] += 1
+                if f.read(1) == bytes((DB_FORMAT_VERSION,)):
+                    f.seek(offset)
+                    value = f.read(size)
+                    if len(value) == size:
+                        return struct.unpack(fmt, value)[0]
+        except OSError:
+            pass
+    # The database needs to be recovered or converted, so load all of it
+    return _get(name)
+
+
+def _replace_file(src, dst):
+    """
+    Rename a file over the top of another one
     """
     try:
-        with open('/data/dawndoor.json', 'r') as f:
-            db = json.load(f)
+        os.rename(src, dst)
     except OSError:
-        db = {}
-    return db
+        # Some filesystems won't rename over an existing file
+        os.remove(dst)
+        os.rename(src, dst)
 
 
-def _save_db(db):
-    with open('/data/dawndoor.json', 'w') as f:
-        json.dump(db, f)
+def flush():
+    """
+    Write the database to flash if it has changed. The data is written to a temporary file first and then renamed, so
+    that losing power in the middle of a write can't corrupt the database.
+    """
+    global _dirty, _migrated
+    if not _dirty:
+        return
+    tmp_fname = DB_FILE + '.tmp'
+    with open(tmp_fname, 'wb') as f:
+        f.write(_db)
+    _replace_file(tmp_fname, DB_FILE)
+    _dirty = False
+    _stats['writes'] += 1
+    if _migrated:
+        try:
+            os.remove(JSON_DB_FILE)
+        except OSError:
+            pass
+        _migrated = False
+
+
+async def persist(delay=SAVE_DELAY):
+    """
+    Write changes to flash once the database has not been changed for ``delay`` seconds, so that several saves made
+    in quick succession only cause a single write
+    """
+    seen_version = _version
+    while True:
+        await asyncio.sleep(delay)
+        if _dirty and _version == seen_version:
+            flush()
+        seen_version = _version
+
+
+def reload():
+    """
+    Drop the in-memory copy of the database so that the next access reads it from flash again. Unsaved changes are
+    written to flash first.
+    """
+    global _db
+    flush()
+    _db = None
+
+
+def get_version():
+    """
+    Return a number that changes every time the data is changed, so that anything derived from it can be cached
+    """
+    return _version
+
+
+def get_stats():
+    """
+    Return the cache hit/miss and flash read/write counters
+    """
+    return dict(_stats)
 
 
 def has_config():
     """
     Determine if there is existing configuration
     """
-    return bool(_load_db())
+    return bool(_get('flags') & (HAS_LOCATION | HAS_NETWORK | HAS_DOOR_CONFIG) or _get('door_status'))
 
 
 def get_location():
     """
     Load the location info from flash
     """
-    return _load_db().get('location')
+    if not _get('flags') & HAS_LOCATION:
+        return None
+    return {
+        'latitude': _get('latitude'),
+        'longitude': _get('longitude'),
+        'timezone': _get_str('timezone')
+    }
+
+
+def _save_location(location):
+    _set('latitude', int(location['latitude']))
+    _set('longitude', int(location['longitude']))
+    _set_str('timezone', location['timezone'])
+    _set('flags', _get('flags') | HAS_LOCATION)
+    _save_db()
 
 
 def save_location(latitude=None, longitude=None, timezone=None):
     """
     Save the timezone to the filesystem
     """
-    db = _load_db()
-    db['location'] = {
+    location = {
         'latitude': latitude,
         'longitude': longitude,
         'timezone': timezone
     }
-    _save_db(db)
+    if get_location() != location:
+        # The sunrise and sunset table is only valid for the location it was generated for
+        clear_sun_table()
+    _save_location(location)
 
 
 def get_network():
     """
     Get the WiFi config. If there is none, return None.
     """
-    return _load_db().get('network')
+    flags = _get('flags')
+    if not flags & HAS_NETWORK:
+        return None
+    return {
+        'essid': _get_str('essid'),
+        'password': _get_str('password'),
+        'can_start_ap': bool(flags & CAN_START_AP)
+    }
 
 
 def save_network(**kwargs):
     """
     Write the network config to file
     """
-    db = _load_db()
-    config = db.get('network')
-    if not config:
-        config = {}
+    config = get_network() or {'can_start_ap': True}
     config.update(kwargs)
-    db['network'] = config
-    _save_db(db)
+    _set_str('essid', config.get('essid'))
+    _set_str('password', config.get('password'))
+    flags = _get('flags') | HAS_NETWORK
+    if config['can_start_ap']:
+        flags |= CAN_START_AP
+    else:
+        flags &= ~CAN_START_AP
+    _set('flags', flags)
+    _save_db()
 
 
 def get_door_status():
     """
     Load the current status of the door
     """
-    door_status = _load_db().get('door_status')
-    if not door_status:
-        door_status = 'Closed'
-    return door_status
+    return DOOR_STATUSES[read_field('door_status')] or 'Closed'
 
 
 def save_door_status(door_status):
     """
-    Save the current door status
+    Save the current door status, either 'Open' or 'Closed'
     """
-    db = _load_db()
-    db['door_status'] = door_status
-    _save_db(db)
+    _set('door_status', DOOR_STATUSES.index(door_status))
+    _save_db()
 
 
 def get_door_config():
     """
     Load the door configuration
     """
-    return _load_db().get('door_config', {})
+    if not _get('flags') & HAS_DOOR_CONFIG:
+        return {}
+    return {'duration': _get('duration')}
 
 
 def save_door_config(door_config):
     """
-    Save the door configuration
+    Save the door configuration. Only the duration is stored.
     """
-    db = _load_db()
-    db['door_config'] = door_config
-    _save_db(db)
+    _set('duration', int(door_config.get('duration', 10)))
+    _set('flags', _get('flags') | HAS_DOOR_CONFIG)
+    _save_db()
 
 
-def get_sunrise_sunset(date):
+def has_sun_table():
     """
-    Get the sunrise and sunset for the day
+    Determine if the sunrise and sunset table has been generated
     """
-    data = _load_db().get('sunrise_sunset')
-    if data and str(date) in data:
-        return data[str(date)]
-    else:
-        return None
+    try:
+        os.stat(SUN_TABLE_FILE)
+        return True
+    except OSError:
+        return False
 
 
-def save_sunrise_sunset(sunrise, sunset):
+def save_sun_table(table):
     """
-    Save the sunrise and sunset for the day
+    Save the table of sunrise and sunset times for the year, as generated by ``astro.calculate_sun_table``
     """
-    date = str(sunrise)
-    db = _load_db()
-    db['sunrise_sunset'] = {
-        date: {
-            'sunrise': sunrise.serialize(),
-            'sunset': sunset.serialize()
-        }
-    }
-    _save_db(db)
+    global _sun_entry, _version
+    tmp_fname = SUN_TABLE_FILE + '.tmp'
+    with open(tmp_fname, 'wb') as f:
+        f.write(table)
+    _replace_file(tmp_fname, SUN_TABLE_FILE)
+    _sun_entry = None
+    _version += 1
+
+
+def clear_sun_table():
+    """
+    Remove the sunrise and sunset table, so that it gets generated again
+    """
+    global _sun_entry, _version
+    _sun_entry = None
+    _version += 1
+    try:
+        os.remove(SUN_TABLE_FILE)
+    except OSError:
+        pass
+
+
+def get_sunrise_sunset(date):
+    """
+    Get the sunrise and sunset for the day from the sunrise and sunset table, as a tuple of DateTime objects. Returns
+    None if there is no table, or if the sun does not rise or set on that day.
+    """
+    global _sun_entry
+    if not _sun_entry or _sun_entry[0] != date.doy:
+        try:
+            with open(SUN_TABLE_FILE, 'rb') as f:
+                f.seek((date.doy - 1) * 4)
+                entry = f.read(4)
+        except OSError:
+            return None
+        if len(entry) < 4:
+            return None
+        _sun_entry = (date.doy,) + struct.unpack('<HH', entry)
+    sunrise, sunset = _sun_entry[1], _sun_entry[2]
+    if sunrise == NO_SUN or sunset == NO_SUN:
+        return None
+    return (DateTime(date.year, date.month, date.day, sunrise // 60, sunrise % 60, 0, date.dow, date.doy),
+            DateTime(date.year, date.month, date.day, sunset // 60, sunset % 60, 0, date.dow, date.doy))
@@ -59,25 +59,27 @@ class Time(object):
 
 class Date(object):
     """
-    A basic date object
+    A basic date object. It is stored as either the date fields or a timestamp, and the other one is only worked out
+    (once) when it is needed.
     """
+    __slots__ = ('_ts', '_tm')
+
     def __init__(self, year=None, month=None, day=None, dow=None, doy=None):
         """
         Initialise the object
         """
-        self.year = year
-        self.month = month
-        self.day = day
-        if not dow and (year and month and day):
-            # Get seconds since epoch, and run that back to localtime to get day of week
-            self.dow = time.localtime(time.mktime((year, month, day, 0, 0, 0, 0, 0)))[6]
-        else:
-            self.dow = dow
-        if not doy and (year and month and day):
-            # Get seconds since epoch, and run that back to localtime to get day of year
-            self.doy = time.localtime(time.mktime((year, month, day, 0, 0, 0, 0, 0)))[7]
-        else:
-            self.doy = doy
+        self._ts = None
+        self._tm = (year, month, day, None, None, None, dow, doy)
+
+    @classmethod
+    def from_timestamp(cls, timestamp):
+        """
+        Return an object for a timestamp, without working out the fields until they are used
+        """
+        obj = cls()
+        obj._ts = int(timestamp)
+        obj._tm = None
+        return obj
 
     @classmethod
     def today(cls):
@@ -85,7 +87,49 @@ class Date(object):
         Return a pre-populated date object for today
         """
         timestamp = time.localtime()
-        return Date(timestamp[0], timestamp[1], timestamp[3], timestamp[6], timestamp[7])
+        return Date(timestamp[0], timestamp[1], timestamp[2], timestamp[6], timestamp[7])
+
+    def _field(self, index):
+        """
+        Return one of the fields, in the same order as time.localtime()
+        """
+        tm = self._tm
+        if tm is None:
+            tm = self._tm = time.localtime(self._ts)
+        value = tm[index]
+        if value is None and index >= 6 and tm[0] and tm[1] and tm[2]:
+            # The day of the week and year weren't given, so get them from the timestamp
+            timestamp = time.localtime(self.unixtime())
+            tm = self._tm = tm[:6] + (timestamp[6], timestamp[7])
+            value = tm[index]
+        return value
+
+    year = property(lambda self: self._field(0))
+    month = property(lambda self: self._field(1))
+    day = property(lambda self: self._field(2))
+    dow = property(lambda self: self._field(6))
+    doy = property(lambda self: self._field(7))
+
+    def unixtime(self):
+        """
+        Return a unix timestamp
+        """
+        if self._ts is None:
+            tm = self._tm
+            self._ts = time.mktime((tm[0] or 0, tm[1] or 0, tm[2] or 0, tm[3] or 0, tm[4] or 0, tm[5] or 0, 0, 0))
+        return self._ts
+
+    def __gt__(self, other):
+        """
+        Greater than operator
+        """
+        return self.unixtime() > other.unixtime()
+
+    def __lt__(self, other):
+        """
+        Less than operator
+        """
+        return self.unixtime() < other.unixtime()
 
     def __str__(self):
         """
@@ -98,27 +142,31 @@ class DateTime(Date):
     """
     A basic object to hold a date and time
     """
+    __slots__ = ()
+
     def __init__(self, year=None, month=None, day=None, hour=None, minute=None, second=None, dow=None, doy=None):
         """
         Initialise the object
         """
-        super().__init__(year, month, day, dow, doy)
-        self.hour = hour
-        self.minute = minute
-        self.second = second
+        self._ts = None
+        self._tm = (year, month, day, hour, minute, second, dow, doy)
+
+    hour = property(lambda self: self._field(3))
+    minute = property(lambda self: self._field(4))
+    second = property(lambda self: self._field(5))
 
     @classmethod
     def now(cls):
         """
         Instantiate a new DateTime class based on the current time
         """
-        return DateTime(*time.localtime())
+        return cls.from_timestamp(time.time())
 
     def date(self):
         """
         Return a Date object of just the date
         """
-        return Date(self.year, self.month, self.day)
+        return Date(self.year, self.month, self.day, self.dow, self.doy)
 
     def time(self):
         """
@@ -126,15 +174,6 @@ class DateTime(Date):
         """
         return Time(self.hour, self.minute, self.second)
 
-    def unixtime(self):
-        """
-        Return a unix timestamp
-        """
-        return time.mktime(
-            (self.year or 0, self.month or 0, self.day or 0, self.hour or 0, self.minute or 0, self.second or 0,
-             self.dow or 0, self.doy or 0)
-        )
-
     def as_timezone(self, tz):
         """
         Return the time as per the timezone
@@ -142,8 +181,7 @@ class DateTime(Date):
         offset = tz_to_offset(tz)
         if TIMEZONES.get(tz, {}).get('dst') and is_dst(self):
             offset += 1
-        offset_secs = offset * 3600
-        return DateTime(*time.gmtime(self.unixtime() + offset_secs))
+        return DateTime.from_timestamp(self.unixtime() + offset * 3600)
 
     def replace(self, year=None, month=None, day=None, hour=None, minute=None, second=None, dow=None, doy=None):
         """
@@ -163,18 +201,6 @@ class DateTime(Date):
                 obj[attr] = val
         return obj
 
-    def __gt__(self, other):
-        """
-        Greater than operator
-        """
-        return self.unixtime() > other.unixtime()
-
-    def __lt__(self, other):
-        """
-        Less than operator
-        """
-        return self.unixtime() < other.unixtime()
-
 
 def is_dst(date):
     """
@@ -0,0 +1,107 @@
+"""
+A journal of every time the door moved, kept in a fixed-size ring file on flash.
+
+Each entry has a sequence number, so the newest entry can be found without a header that would have to be rewritten.
+Appending an entry only writes that entry, over the oldest one once the file is full.
+"""
+import struct
+import time
+
+JOURNAL_FILE = '/data/journal.bin'
+JOURNAL_SIZE = 512
+PAGE_SIZE = 20
+# Sequence number, timestamp, action, trigger and motor duration in seconds. A sequence number of 0 is an empty slot.
+ENTRY_FORMAT = '<IIBBH'
+ENTRY_SIZE = struct.calcsize(ENTRY_FORMAT)
+# Actions and triggers are stored as an index into these tuples
+ACTIONS = (None, 'open', 'close')
+TRIGGERS = (None, 'schedule', 'manual', 'api')
+
+_last_seq = None
+
+
+def _create():
+    """
+    Fill the journal file with empty slots
+    """
+    empty = bytes(ENTRY_SIZE)
+    with open(JOURNAL_FILE, 'wb') as f:
+        for _ in range(JOURNAL_SIZE):
+            f.write(empty)
+
+
+def get_last_seq():
+    """
+    Return the sequence number of the newest entry, or 0 if the journal is empty. The journal is only scanned the
+    first time.
+    """
+    global _last_seq
+    if _last_seq is not None:
+        return _last_seq
+    _last_seq = 0
+    buf = bytearray(ENTRY_SIZE * 32)
+    try:
+        with open(JOURNAL_FILE, 'rb') as f:
+            while True:
+                size = f.readinto(buf)
+                if not size:
+                    break
+                for offset in range(0, size - ENTRY_SIZE + 1, ENTRY_SIZE):
+                    seq = struct.unpack_from('<I', buf, offset)[0]
+                    if seq > _last_seq:
+                        _last_seq = seq
+    except OSError:
+        pass
+    return _last_seq
+
+
+def append(action, trigger, duration=0, timestamp=None):
+    """
+    Add an entry to the journal
+
+    :param action: 'open' or 'close'
+    :param trigger: What moved the door: 'schedule', 'manual' or 'api'
+    :param duration: How long the motor ran for, in seconds
+    :param timestamp: When the door moved. Defaults to now.
+    """
+    global _last_seq
+    entry = struct.pack(ENTRY_FORMAT, get_last_seq() + 1, int(time.time() if timestamp is None else timestamp),
+                        ACTIONS.index(action), TRIGGERS.index(trigger), min(int(duration), 0xffff))
+    try:
+        f = open(JOURNAL_FILE, 'r+b')
+    except OSError:
+        _create()
+        f = open(JOURNAL_FILE, 'r+b')
+    with f:
+        f.seek(((_last_seq + 1) % JOURNAL_SIZE) * ENTRY_SIZE)
+        f.write(entry)
+    _last_seq += 1
+
+
+def read_page(before=None, limit=PAGE_SIZE):
+    """
+    Return up to ``limit`` entries older than the sequence number ``before`` (or the newest ones), newest first, as
+    tuples of (seq, timestamp, action, trigger, duration). Pass the seq of the last entry as ``before`` to get the
+    next page.
+    """
+    last_seq = get_last_seq()
+    seq = last_seq if before is None else min(before - 1, last_seq)
+    oldest = max(last_seq - JOURNAL_SIZE + 1, 1)
+    entries = []
+    if seq < oldest:
+        return entries
+    buf = bytearray(ENTRY_SIZE)
+    with open(JOURNAL_FILE, 'rb') as f:
+        while seq >= oldest and len(entries) < limit:
+            f.seek((seq % JOURNAL_SIZE) * ENTRY_SIZE)
+            if f.readinto(buf) < ENTRY_SIZE:
+                break
+            entry_seq, timestamp, action, trigger, duration = struct.unpack(ENTRY_FORMAT, buf)
+            if entry_seq != seq:
+                break
+            entries.append((seq, timestamp, ACTIONS[action], TRIGGERS[trigger], duration))
+            seq -= 1
+    return entries
+
+
+__all__ = ['append', 'get_last_seq', 'read_page']
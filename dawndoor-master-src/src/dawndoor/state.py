@@ -1,10 +1,19 @@
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+
 class State(object):
     """
-    An object that can be used to keep track of state
+    An object that can be used to keep track of state. Tasks can wait for a state variable to change, instead of
+    polling it.
     """
 
     def __init__(self, *args, **kwargs):
         self._storage = {}
+        self._events = {}
+        self._subscribers = {}
         for item in args:
             if isinstance(item, dict):
                 self._storage.update(item)
@@ -12,12 +21,21 @@ class State(object):
 
     def set(self, key, value):
         """
-        Set a particular state variable
+        Set a particular state variable. If the value is different, any tasks waiting for the variable are woken up
+        and the subscribers are called.
 
         :param key: The name of the state variable
         :param value: The value to assign to the variable
         """
+        if key in self._storage and self._storage[key] == value:
+            return
         self._storage[key] = value
+        # Each event is only used once, so that a task which waits again only wakes up on the next change
+        event = self._events.pop(key, None)
+        if event:
+            event.set()
+        for callback in self._subscribers.get(key, ()):
+            callback(key, value)
 
     def get(self, key, default=None):
         """
@@ -27,3 +45,44 @@ class State(object):
         :param default: The default value if there is no variable
         """
         return self._storage.get(key, default)
+
+    def subscribe(self, key, callback):
+        """
+        Call ``callback(key, value)`` whenever a state variable changes
+
+        :param key: The name of the state variable
+        :param callback: The function to call
+        """
+        self._subscribers.setdefault(key, []).append(callback)
+
+    def unsubscribe(self, key, callback):
+        """
+        Stop calling a function when a state variable changes
+
+        :param key: The name of the state variable
+        :param callback: The function that was subscribed
+        """
+        if callback in self._subscribers.get(key, ()):
+            self._subscribers[key].remove(callback)
+
+    async def changed(self, key):
+        """
+        Wait until a state variable changes, and return the new value
+
+        :param key: The name of the state variable
+        """
+        event = self._events.get(key)
+        if event is None:
+            event = self._events[key] = asyncio.Event()
+        await event.wait()
+        return self._storage.get(key)
+
+    async def wait_for(self, key, value=True):
+        """
+        Wait until a state variable has a particular value. Returns straight away if it already has that value.
+
+        :param key: The name of the state variable
+        :param value: The value to wait for. Defaults to True.
+        """
+        while self._storage.get(key) != value:
+            await self.changed(key)
@@ -62,6 +62,8 @@ function updateUI() {
     let essid = getValue(data["network"], "essid", "");
     let password = getValue(data["network"], "password", "");
     let can_start_ap = getValue(data["network"], "can_start_ap", true);
+    let connected = getValue(data["network"], "connected", false);
+    $("span.connection").innerHTML = connected ? "Connected" : "Not connected";
     $("span.ip-address").innerHTML = data["network"]["ip_address"];
     $("#essid").value = essid;
     $("#password").value = password;
@@ -83,36 +85,52 @@ function updateUI() {
     $("#timezone").value = timezone;
     $("span.timezone").innerHTML = timezoneName;
   }
+  // Sunrise and sunset
+  let sun = getValue(data, "sun");
+  $("span.sunrise").innerHTML = sun ? sun["sunrise"] : "(unknown)";
+  $("span.sunset").innerHTML = sun ? sun["sunset"] : "(unknown)";
+}
+
+function setData(responseData) {
+  data["location"] = responseData["location"];
+  data["network"] = responseData["network"];
+  data["door"] = responseData["door"];
+  data["sun"] = responseData["sun"];
+  console.log(responseData);
+  updateUI();
 }
 
 function loadData() {
-  fetch("/location")
-    .then(function (response) {
-      return response.json();
-    })
-    .then(function (responseData) {
-      data["location"] = responseData;
-      console.log(responseData);
-      updateUI();
-    });
-  fetch("/network")
-    .then(function (response) {
-      return response.json();
-    })
-    .then(function (responseData) {
-      data["network"] = responseData;
-      console.log(responseData);
-      updateUI();
-    });
-  fetch("/door")
+  // The page comes with the data in it, so it only needs to be fetched if it's missing
+  let status = $("#status");
+  if (status && status.textContent.trim()) {
+    setData(JSON.parse(status.textContent));
+    return;
+  }
+  fetch("/status")
     .then(function (response) {
       return response.json();
     })
-    .then(function (responseData) {
-      data["door"] = responseData;
-      console.log(responseData);
-      updateUI();
-    });
+    .then(setData);
+}
+
+function listenForEvents() {
+  if (!window.EventSource) {
+    return;
+  }
+  let source = new EventSource("/events");
+  source.addEventListener("door", function (event) {
+    data["door"] = Object.assign(data["door"] || {}, JSON.parse(event.data));
+    updateUI();
+  });
+  source.addEventListener("network", function (event) {
+    data["network"] = Object.assign(data["network"] || {}, JSON.parse(event.data));
+    updateUI();
+  });
+  source.addEventListener("sun", function (event) {
+    data["sun"] = JSON.parse(event.data);
+    updateUI();
+  });
 }
 
 function saveLocation() {
@@ -216,5 +234,6 @@ document.addEventListener('readystatechange', event => {
     setUpUI();
     setUpForms();
     loadData();
+    listenForEvents();
   }
 });
@@ -0,0 +1,23 @@
+"""
+Fixtures for the tests that run the app on the simulated hardware
+"""
+import contextlib
+import io
+import os
+import shutil
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def app():
+    """
+    The app, set up the same way as for tools/benchmark.py, with its data in a temporary directory
+    """
+    import benchmark
+    cwd = os.getcwd()
+    with contextlib.redirect_stdout(io.StringIO()):
+        app, data_dir = benchmark.setup()
+    yield app
+    os.chdir(cwd)
+    shutil.rmtree(data_dir, ignore_errors=True)
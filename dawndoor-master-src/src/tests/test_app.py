@@ -0,0 +1,109 @@
+"""
+Test the DawnDoor app on the simulated hardware
+"""
+import hostsim
+from hostsim import uasyncio
+from hostsim.streams import StreamReader, StreamWriter, drive
+from machine import Pin
+
+
+def post_door(app, body):
+    """
+    POST a JSON body to /door from inside the event loop, and return the status code of the response
+    """
+    writer = StreamWriter()
+    raw = (b'POST /door HTTP/1.0\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n' % len(body) +
+           body)
+    drive(app.webapp.handle(StreamReader(raw), writer))
+    return bytes(writer.output).split(b' ', 2)[1]
+
+
+def test_door_moves_never_overlap(app):
+    """
+    Test that the door can't be driven both ways at once
+    """
+    # GIVEN: The app with the door closed, and something watching the relays
+    from dawndoor import data
+    data.save_door_status('Closed')
+    relays = [Pin.pins[5], Pin.pins[4]]
+    both_on = []
+    statuses = []
+
+    async def watch_relays():
+        while True:
+            if all(relay.value() for relay in relays):
+                both_on.append(True)
+            await uasyncio.sleep(0.5)
+
+    async def client():
+        statuses.append(post_door(app, b'{"action": "open"}'))
+        await uasyncio.sleep(2)
+        statuses.append(post_door(app, b'{"action": "close"}'))
+        statuses.append(post_door(app, b'{"status": "Closed"}'))
+        await uasyncio.sleep(30)
+        statuses.append(post_door(app, b'{"action": "close"}'))
+
+    # WHEN: The door is opened, and told to close while it is still opening, and then closed once it has opened
+    hostsim.run_for(60, watch_relays(), client())
+
+    # THEN: The requests made while the door was moving should get a 409, and both relays should never be on
+    assert statuses == [b'200', b'409', b'409', b'200']
+    assert not both_on
+    assert data.get_door_status() == 'Closed'
+
+
+def test_scheduled_move_waits_for_api_move(app):
+    """
+    Test that a scheduled move waits for a move from the API to finish, and is skipped if the door is already there
+    """
+    # GIVEN: The app with the door closed
+    from dawndoor import data
+    data.save_door_status('Closed')
+    relays = [Pin.pins[5], Pin.pins[4]]
+    changes = sum(relay.changes for relay in relays)
+
+    # WHEN: The door is opened from the API, and then by the schedule while it is still opening
+    hostsim.run_for(60, app.move_door('open', 'api'), app.move_door('open', 'schedule'))
+
+    # THEN: The door should only have moved once
+    assert data.get_door_status() == 'Open'
+    assert sum(relay.changes for relay in relays) - changes == 2
+
+
+def test_connection_changes_are_published(app):
+    """
+    Test that the WiFi connection going down and coming back up is sent to browsers, and that the time is set once it
+    is back
+    """
+    # GIVEN: The app, which last saw the WiFi up, and a browser listening for events
+    import ntptime
+    from network import WLAN, STA_IF
+    wlan = WLAN(STA_IF)
+    app.check_connection()
+    pending, ready = subscriber = ({}, uasyncio.Event())
+    app.events.subscribers.append(subscriber)
+    seen = []
+    calls = ntptime.calls
+
+    async def watch_events():
+        while True:
+            await ready.wait()
+            ready.clear()
+            seen.append(pending.pop('network'))
+
+    async def reconnect():
+        await uasyncio.sleep(20)
+        wlan.connect('Coop', 'hunter2')
+
+    # WHEN: The WiFi goes down, and comes back up 20 seconds later
+    wlan.disconnect()
+    try:
+        hostsim.run_for(60, app.watch_connection(), app.set_time(), watch_events(), reconnect())
+    finally:
+        app.events.subscribers.remove(subscriber)
+
+    # THEN: The browser should be told when it went down and came back up, and the time should be set once it was back
+    assert ['"connected": false' in event for event in seen] == [True, False]
+    assert '"ip_address": "192.168.1.50"' in seen[-1]
+    assert app.state.get('is_connected')
+    assert ntptime.calls == calls + 1
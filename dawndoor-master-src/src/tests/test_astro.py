@@ -0,0 +1,90 @@
+"""
+Check that the vectorised sunrise and sunset calculation gives the same minutes as the scalar code on the device
+"""
+import random
+
+import pytest
+
+from dawndoor.astro import NO_SUN, _calculate_sun_times_scalar, calculate_sun_table, calculate_sun_times
+from dawndoor.datetime import Date
+
+np = pytest.importorskip('numpy')
+
+
+def test_calculate_sun_times_matches_scalar():
+    """
+    Test that the NumPy path matches the scalar path for random days, locations and timezones
+    """
+    # GIVEN: Random days, latitudes, longitudes and timezones
+    rand = random.Random(1234)
+    size = 3000
+    days = [rand.randint(1, 366) for _ in range(size)]
+    latitudes = [rand.uniform(-90, 90) for _ in range(size)]
+    longitudes = [rand.uniform(-180, 180) for _ in range(size)]
+    timezones = [rand.randint(-12, 14) for _ in range(size)]
+
+    # WHEN: The sun times are calculated both ways
+    sunrises, sunsets = calculate_sun_times(days, latitudes, longitudes, timezones)
+    expected_sunrises, expected_sunsets = _calculate_sun_times_scalar(days, latitudes, longitudes, timezones)
+
+    # THEN: They should be the same
+    assert sunrises.tolist() == expected_sunrises
+    assert sunsets.tolist() == expected_sunsets
+
+
+def test_calculate_sun_times_polar():
+    """
+    Test that days without a sunrise or sunset are marked with NO_SUN, the same as the scalar path
+    """
+    # GIVEN: The north and south poles, at midwinter and midsummer
+    days = [172, 172, 355, 355]
+    latitudes = [89, -89, 89, -89]
+
+    # WHEN: The sun times are calculated both ways
+    sunrises, sunsets = calculate_sun_times(days, latitudes, 0, 0)
+    expected_sunrises, expected_sunsets = _calculate_sun_times_scalar(days, latitudes, 0, 0)
+
+    # THEN: There should be no sunrise or sunset on any of them, the same as the scalar path
+    assert sunrises.tolist() == [NO_SUN] * 4
+    assert sunsets.tolist() == [NO_SUN] * 4
+    assert sunrises.tolist() == expected_sunrises
+    assert sunsets.tolist() == expected_sunsets
+
+
+def test_calculate_sun_times_matches_sun_table():
+    """
+    Test that a year of sun times for a location matches the table stored on the device
+    """
+    # GIVEN: A year of days, starting with a Date object, and locations including one inside the Arctic Circle
+    days = [Date(2024, 1, 1)] + list(range(2, 367))
+
+    for latitude, longitude, timezone in ((52.2, 0.1, 1), (70, 25, 2), (-33.9, 18.4, 2)):
+        # WHEN: The sun times are calculated for every day, and the table is calculated
+        sunrises, sunsets = calculate_sun_times(days, latitude, longitude, timezone)
+        table = calculate_sun_table(latitude, longitude, timezone)
+
+        # THEN: They should match
+        expected = np.frombuffer(bytes(table), dtype='<u2').reshape(-1, 2)
+        assert sunrises.tolist() == expected[:, 0].tolist()
+        assert sunsets.tolist() == expected[:, 1].tolist()
+
+
+def test_calculate_sun_times_broadcasts():
+    """
+    Test that an array of sites broadcasts against an array of days
+    """
+    # GIVEN: Three sites as a column, and a year of days
+    latitudes = np.array([[52.2], [70], [-33.9]])
+    longitudes = np.array([[0.1], [25], [18.4]])
+    days = np.arange(1, 367)
+
+    # WHEN: The sun times are calculated
+    sunrises, sunsets = calculate_sun_times(days, latitudes, longitudes, 2)
+
+    # THEN: There should be a row per site, matching the sun table for that site
+    assert sunrises.shape == (3, 366)
+    assert sunsets.shape == (3, 366)
+    for row in range(3):
+        table = calculate_sun_table(latitudes[row, 0], longitudes[row, 0], 2)
+        expected = np.frombuffer(bytes(table), dtype='<u2').reshape(-1, 2)
+        assert sunrises[row].tolist() == expected[:, 0].tolist()
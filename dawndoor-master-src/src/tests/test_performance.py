@@ -0,0 +1,128 @@
+"""
+Run the benchmarks from tools/benchmark.py and check the numbers that don't depend on the speed of the host: how often
+the device wakes up, how much is sent to the display, and how big the writes and records are. Timings are only compared
+with each other, never with a fixed number. A change that makes any of these worse fails the tests.
+"""
+import io
+
+import benchmark
+from hostsim.streams import StreamWriter, drive
+
+from dawndoor import data
+from dawndoor.web import JSON_BUFFER_SIZE, sendstream
+
+# One redraw a minute, plus one for the door moving
+DISPLAY_MAX_WAKEUPS = 61
+# The time only changes a few characters, so an hour of updates is less than four full frames of 1 KiB
+DISPLAY_MAX_I2C_BYTES = 4096
+# Each redraw sends a window and the changed columns for a few pages
+DISPLAY_MAX_I2C_TRANSACTIONS = 3 * DISPLAY_MAX_WAKEUPS
+
+
+def run(func, app):
+    """
+    Run a benchmark and return its results as a dict of label: value
+    """
+    return {label: value for label, value, unit in func(app)}
+
+
+def test_door_check_wakeups(app):
+    """
+    Test that the door task only wakes up to move the door, rather than polling
+    """
+    # GIVEN: The app, with a location in the UK
+
+    # WHEN: The door task runs for a week
+    results = run(benchmark.door_check, app)
+
+    # THEN: The door should have opened and closed every day, with about one wake-up per move
+    assert results['door moves'] == 14
+    assert results['wake-ups'] <= 2 * results['door moves'] + 2
+
+
+def test_display_time_wakeups_and_i2c(app):
+    """
+    Test that the display only wakes up when the time or the door changes, and only sends what changed
+    """
+    # GIVEN: The app
+
+    # WHEN: The display runs for an hour, with the door moving once
+    results = run(benchmark.display_time, app)
+
+    # THEN: It should wake up once a minute, and send much less than a full frame each time
+    assert results['wake-ups'] <= DISPLAY_MAX_WAKEUPS
+    assert results['I2C transactions'] <= DISPLAY_MAX_I2C_TRANSACTIONS
+    assert results['I2C bytes'] <= DISPLAY_MAX_I2C_BYTES
+
+
+def test_route_dispatch_does_not_scan(app):
+    """
+    Test that looking up a plain route doesn't get slower as more routes are added
+    """
+    # GIVEN: The app
+
+    # WHEN: The last of 10, 100 and 1000 routes is looked up, with WebApp and with a scan of a list
+    results = run(benchmark.route_dispatch, app)
+
+    # THEN: With 1000 routes, WebApp should be many times faster than a scan, and not much slower than with 10
+    assert results['1000 routes, dict'] * 10 < results['1000 routes, scan']
+    assert results['1000 routes, dict'] < results['10 routes, dict'] * 3
+
+
+def test_jsonify_bounded_writes(app):
+    """
+    Test that a large JSON response is streamed without ever building it up in memory
+    """
+    # GIVEN: The app
+
+    # WHEN: 1000 journal entries are sent as JSON
+    results = run(benchmark.jsonify, app)
+
+    # THEN: The response should be big, but no single write should be bigger than the buffer
+    assert results['response size'] > 100 * 1024
+    assert results['largest write'] <= JSON_BUFFER_SIZE
+
+
+def test_sendstream_uses_whole_buffer(app):
+    """
+    Test that files are sent a full buffer at a time
+    """
+    # GIVEN: 64 KiB of content and the app's send buffer
+    content = bytes(range(256)) * 256
+    buf = app.webapp.send_buffer
+    writer = StreamWriter(keep=False)
+
+    # WHEN: The content is sent
+    drive(sendstream(writer, io.BytesIO(content), buf))
+
+    # THEN: It should all be sent, in as few writes as the buffer allows
+    assert writer.bytes == len(content)
+    assert writer.writes == len(content) // len(buf)
+
+
+def test_sendfile_loopback(app):
+    """
+    Test that a file is sent whole to a real client, and faster with the app's buffer than with the old one
+    """
+    # GIVEN: The app
+
+    # WHEN: A 256 KiB file is downloaded over a local socket
+    results = run(benchmark.sendfile_loopback, app)
+
+    # THEN: All of it should arrive, and the bigger buffer should be faster
+    assert results['body received'] == 256 * 1024
+    assert results['512-byte buffer'] > results['64-byte buffer']
+
+
+def test_config_record_size(app):
+    """
+    Test that the config is stored as a fixed-size binary record, smaller than the old JSON file
+    """
+    # GIVEN: The app, with a location, a network and a door set up
+
+    # WHEN: The config is written and read back both ways
+    results = run(benchmark.config, app)
+
+    # THEN: The binary record should be its fixed size, and smaller than the JSON
+    assert results['binary size'] == data.DB_RECORD_SIZE
+    assert results['binary size'] < results['JSON size']
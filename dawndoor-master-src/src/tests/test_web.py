@@ -0,0 +1,196 @@
+"""
+Test the web server, by sending it raw requests through in-memory streams
+"""
+from hostsim.clock import clock
+from hostsim.streams import request
+
+from dawndoor.web import WebApp, jsonify, start_response
+
+
+def make_app(**kwargs):
+    """
+    Create a WebApp with a route that says hello, and one that sends back the form it was posted
+    """
+    webapp = WebApp(**kwargs)
+
+    @webapp.route('/', method='GET')
+    def index(req, resp):
+        yield from start_response(resp, 'text/plain')
+        yield from resp.awrite('hello')
+
+    @webapp.route('/form', method='POST', headers=(b'Content-Type', b'Content-Length'))
+    def form(req, resp):
+        yield from req.read_form_data()
+        yield from jsonify(resp, req.form)
+
+    return webapp
+
+
+def post(body, content_type=b'application/x-www-form-urlencoded'):
+    """
+    Make a raw POST request to /form
+    """
+    return (b'POST /form HTTP/1.0\r\nContent-Type: %s\r\nContent-Length: %d\r\n\r\n' % (content_type, len(body)) +
+            body)
+
+
+def status(writer):
+    """
+    Return the status code of a response
+    """
+    return bytes(writer.output).split(b' ', 2)[1]
+
+
+def test_idle_connection_is_closed():
+    """
+    Test that a kept-alive connection is closed when the next request doesn't arrive in time
+    """
+    # GIVEN: An app with keep-alive, and a client that sends two requests and then keeps the connection open
+    webapp = make_app(keep_alive=True, idle_timeout=10)
+    start = clock.monotonic()
+
+    # WHEN: The requests are sent
+    writer = request(webapp, b'GET / HTTP/1.1\r\n\r\nGET / HTTP/1.1\r\n\r\n', wait=True)
+
+    # THEN: Both should be answered, and then the connection closed and its slot freed after the idle timeout
+    assert bytes(writer.output).count(b'hello') == 2
+    assert writer.closed
+    assert webapp.connections == 0
+    assert clock.monotonic() - start == 10
+
+
+def test_form_body():
+    """
+    Test that a URL-encoded body is decoded
+    """
+    # GIVEN: An app
+
+    # WHEN: A form is posted, with a multi-byte UTF-8 character, escapes, a plus and a key without a value
+    writer = request(make_app(), post(b'name=caf%C3%A9&a+b=1%262&flag'))
+
+    # THEN: The form should be decoded
+    assert status(writer) == b'200'
+    assert bytes(writer.output).endswith('{"name": "caf\\u00e9", "a b": "1&2", "flag": true}'.encode())
+
+
+def test_form_body_invalid():
+    """
+    Test that a URL-encoded body with bad escapes or invalid UTF-8 gets a 400
+    """
+    # GIVEN: An app
+    webapp = make_app()
+
+    for body in (b'a=%ab', b'%ff=1', b'a=%zz', b'a=%4'):
+        # WHEN: A bad form is posted
+        writer = request(webapp, post(body))
+
+        # THEN: It should get a 400
+        assert status(writer) == b'400', body
+
+
+def test_header_names_any_case():
+    """
+    Test that the headers a route wants are found whatever the case of their names
+    """
+    # GIVEN: An app
+    webapp = make_app()
+
+    for name in (b'Content-Length', b'content-length', b'CONTENT-LENGTH', b'cOnTeNt-LeNgTh'):
+        # WHEN: A form is posted with the Content-Length in that case
+        writer = request(webapp, b'POST /form HTTP/1.0\r\n%s: 3\r\n\r\na=1' % name)
+
+        # THEN: The body should be read
+        assert bytes(writer.output).endswith(b'{"a": "1"}'), name
+
+
+def test_too_many_headers():
+    """
+    Test that a request with more than max_headers headers gets a 431
+    """
+    # GIVEN: An app that allows 4 headers
+    webapp = make_app(max_headers=4)
+    headers = b''.join(b'X-Header-%d: %d\r\n' % (index, index) for index in range(5))
+
+    # WHEN: Requests with 4 and 5 headers are sent
+    allowed = request(webapp, b'GET / HTTP/1.0\r\n%s\r\n' % headers[:-len(b'X-Header-4: 4\r\n')])
+    rejected = request(webapp, b'GET / HTTP/1.0\r\n%s\r\n' % headers)
+
+    # THEN: Only the one with too many headers should get a 431
+    assert status(allowed) == b'200'
+    assert status(rejected) == b'431'
+
+
+def test_header_line_too_long():
+    """
+    Test that a request with a header line longer than max_header_line gets a 431
+    """
+    # GIVEN: An app that allows header lines of up to 64 bytes
+    webapp = make_app(max_header_line=64)
+
+    # WHEN: Requests with a 64 byte and a 65 byte header line are sent
+    allowed = request(webapp, b'GET / HTTP/1.0\r\nX-Long: %s\r\n\r\n' % (b'a' * 54))
+    rejected = request(webapp, b'GET / HTTP/1.0\r\nX-Long: %s\r\n\r\n' % (b'a' * 55))
+
+    # THEN: Only the one with the long line should get a 431
+    assert status(allowed) == b'200'
+    assert status(rejected) == b'431'
+
+
+def test_unread_body_skipped_on_keep_alive():
+    """
+    Test that a body the handler doesn't read is skipped, so that the next request on the connection is read properly
+    """
+    # GIVEN: An app with keep-alive
+    webapp = make_app(keep_alive=True)
+
+    # WHEN: A GET with a body (in a mixed-case Content-Length) is followed by another GET on the same connection
+    body = b'GET /x HTTP/1.1\r\n\r\n'
+    writer = request(webapp, b'GET / HTTP/1.1\r\ncontent-LENGTH: %d\r\n\r\n%sGET / HTTP/1.1\r\n\r\n' % (len(body), body))
+
+    # THEN: Both requests should be answered, and the body should not be taken for a request
+    output = bytes(writer.output)
+    assert output.count(b'hello') == 2
+    assert b'404' not in output
+
+
+def test_body_too_large():
+    """
+    Test that a form body bigger than max_body gets a 413 without being read
+    """
+    # GIVEN: An app that allows bodies of up to 16 bytes
+    webapp = make_app(max_body=16)
+
+    # WHEN: Forms of 16 and 17 bytes are posted
+    allowed = request(webapp, post(b'a=' + b'b' * 14))
+    rejected = request(webapp, post(b'a=' + b'b' * 15))
+
+    # THEN: Only the bigger one should get a 413
+    assert status(allowed) == b'200'
+    assert status(rejected) == b'413'
+
+
+def test_static_gzip_and_not_modified(app):
+    """
+    Test that the app sends the gzipped copy of a static file with its own ETag, and a 304 when the browser has it
+    """
+    # GIVEN: The app, with the static files compressed and the ETags of the plain and gzipped copies of app.css
+    entry = app.webapp.load_static_manifest()['app.css']
+    raw = b'GET /static/app.css HTTP/1.0\r\nAccept-Encoding: gzip\r\n'
+
+    # WHEN: The file is requested, and then requested again with its ETag
+    first = request(app.webapp, raw + b'\r\n')
+    second = request(app.webapp, raw + b'If-None-Match: "%s"\r\n\r\n' % entry['gzip']['etag'].encode())
+    plain = request(app.webapp, b'GET /static/app.css HTTP/1.0\r\nIf-None-Match: "%s"\r\n\r\n' %
+                    entry['gzip']['etag'].encode())
+
+    # THEN: The first should get the gzipped copy, the second a 304, and a client without gzip the plain copy
+    first_headers, first_body = bytes(first.output).split(b'\r\n\r\n', 1)
+    assert status(first) == b'200'
+    assert b'Content-Encoding: gzip' in first_headers
+    assert ('ETag: "%s"' % entry['gzip']['etag']).encode() in first_headers
+    assert len(first_body) == entry['gzip']['size']
+    assert status(second) == b'304'
+    assert bytes(second.output).endswith(b'Content-Length: %d\r\n\r\n' % entry['gzip']['size'])
+    assert status(plain) == b'200'
+    assert ('ETag: "%s"' % entry['etag']).encode() in bytes(plain.output)
+    assert b'Content-Encoding' not in bytes(plain.output)
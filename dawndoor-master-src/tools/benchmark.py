@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+# DawnDoor
+# --------
+# Copyright (C) 2021 Raoul Snyman
+#
+# Licensed under the MIT license, see LICENSE.txt for details
+"""
+Benchmarks for the DawnDoor app, run on the host with the hardware simulated by ``hostsim``.
+
+Run all of them with ``python tools/benchmark.py``, or some of them by giving their names. Timings are the best of a
+few runs, in real time. The app's tasks are run in virtual time, so the interesting numbers for them are how often
+the device would wake up and how much is sent to the display.
+
+``src/tests/test_performance.py`` runs these benchmarks under pytest, and fails if the wake-ups, display traffic or
+write sizes get worse.
+"""
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TOOLS_DIR, '..', 'src')
+# The display driver is shared with the pager node, at the top of the repository
+DRIVER_DIR = os.path.join(TOOLS_DIR, '..', '..')
+sys.path[:0] = [TOOLS_DIR, SRC_DIR, DRIVER_DIR]
+
+import hostsim  # noqa: E402
+from hostsim.streams import StreamWriter, drive, request  # noqa: E402
+
+BENCHMARKS = []
+REPEAT = 3
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def best_time(func, number):
+    """
+    Return the best time of REPEAT runs of calling ``func`` ``number`` times, per call
+    """
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / number
+
+
+def setup():
+    """
+    Install the simulator and set up the app with a location, a network and a door, with its data and static files in
+    a temporary directory, which becomes the current directory
+    """
+    hostsim.install()
+    from compress_static import compress_static
+    data_dir = tempfile.mkdtemp(prefix='dawndoor-')
+    # Static files are served from 'static/...' in the current directory, so build a copy with its gzipped files and
+    # manifest there
+    shutil.copytree(os.path.join(SRC_DIR, 'static'), os.path.join(data_dir, 'static'),
+                    ignore=shutil.ignore_patterns('*.gz', 'manifest.json'))
+    compress_static(os.path.join(data_dir, 'static'))
+    os.chdir(data_dir)
+    from dawndoor import app, data, journal
+    from framebuf import FrameBuffer, MONO_HLSB
+    data.DB_FILE = os.path.join(data_dir, 'dawndoor.bin')
+    data.JSON_DB_FILE = os.path.join(data_dir, 'dawndoor.json')
+    data.SUN_TABLE_FILE = os.path.join(data_dir, 'sun.bin')
+    journal.JOURNAL_FILE = os.path.join(data_dir, 'journal.bin')
+    app.webapp.templates_dir = os.path.join(SRC_DIR, 'templates')
+    app.webapp.static_dir = 'static'
+    # The splash screen isn't in the repository
+    app.load_pbm = lambda fname: FrameBuffer(bytearray(8 * 64), 64, 64, MONO_HLSB)
+    data.save_network(essid='Coop', password='hunter2', can_start_ap=False)
+    data.save_door_config({'duration': 10})
+    data.save_door_status('Closed')
+    data.save_location(latitude=52, longitude=0, timezone='UTC')
+    app.connect()
+    app.update_sun_table()
+    app.state.set('is_time_set', True)
+    return app, data_dir
+
+
+def scan_url_map(url_map, method, path):
+    """
+    Find a route the way WebApp used to, by checking every entry of a list of (url, handler, extra) in turn
+    """
+    for pattern, handler, extra in url_map:
+        if isinstance(pattern, str):
+            if path == pattern and extra.get('method', method) == method:
+                return handler, extra, None
+        else:
+            match = pattern.match(path)
+            if match and extra.get('method', method) == method:
+                return handler, extra, match
+    return None
+
+
+@benchmark
+def route_dispatch(app):
+    """
+    Look up the last plain route in tables of different sizes, with the dict in WebApp and with a scan of a list
+    """
+    import re
+    from dawndoor.web import WebApp
+    results = []
+    for size in (10, 100, 1000):
+        webapp = WebApp()
+        url_map = [(re.compile('^/(static/.+)'), webapp.handle_static, {})]
+        for index in range(size):
+            webapp.add_url_rule('/route%d' % index, None, method='GET')
+            url_map.append(('/route%d' % index, None, {'method': 'GET'}))
+        path = '/route%d' % (size - 1)
+        results.append(('%d routes, dict' % size, best_time(lambda: webapp.find_route('GET', path), 2000) * 1e6,
+                        'us'))
+        results.append(('%d routes, scan' % size, best_time(lambda: scan_url_map(url_map, 'GET', path), 200) * 1e6,
+                        'us'))
+    return results
+
+
+@benchmark
+def sendstream(app):
+    """
+    Send 64 KiB through the web server's file streaming, with the app's send buffer, to an in-memory stream
+    """
+    from dawndoor.web import sendstream
+    content = bytes(range(256)) * 256
+    buf = app.webapp.send_buffer
+
+    def send():
+        drive(sendstream(StreamWriter(keep=False), io.BytesIO(content), buf))
+    per_call = best_time(send, 50)
+    return [('per 64 KiB', per_call * 1e3, 'ms'), ('throughput', len(content) / per_call / 1e6, 'MB/s')]
+
+
+@benchmark
+def sendfile_loopback(app):
+    """
+    Download a 256 KiB file from the web server over a local socket, with the old 64-byte buffer and the app's one
+
+    The server and the client run on a real asyncio event loop, rather than the virtual one.
+    """
+    import asyncio
+    from dawndoor.web import WebApp
+    content = bytes(range(256)) * 1024
+    fd, fname = tempfile.mkstemp(prefix='dawndoor-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+
+    async def download(port):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /file HTTP/1.0\r\n\r\n')
+        response = await reader.read()
+        writer.close()
+        await writer.wait_closed()
+        return response
+
+    async def serve(webapp):
+        server = await hostsim.uasyncio.start_server(webapp.handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        best = None
+        for _ in range(REPEAT * 3):
+            start = time.perf_counter()
+            response = await download(port)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        server.close()
+        await server.wait_closed()
+        return best, response
+
+    results = []
+    loop = asyncio.new_event_loop()
+    try:
+        for buffer_size in (64, len(app.webapp.send_buffer)):
+            webapp = WebApp(send_buffer_size=buffer_size)
+            webapp.add_url_rule('/file', lambda request, response, webapp=webapp: webapp.sendfile(response, fname),
+                                method='GET', headers='skip')
+            best, response = loop.run_until_complete(serve(webapp))
+            results.append(('%d-byte buffer' % buffer_size, len(content) / best / 1e6, 'MB/s'))
+        results.append(('body received', len(response.split(b'\r\n\r\n', 1)[1]), 'bytes'))
+    finally:
+        loop.close()
+        os.remove(fname)
+    return results
+
+
+@benchmark
+def datetime(app):
+    """
+    Get the local time, compare it with today's sunrise and sunset and format it, like door_check and display_time
+    """
+    from dawndoor.datetime import DateTime
+    from dawndoor import data
+
+    def check():
+        now = DateTime.now().as_timezone('EST')
+        sunrise, sunset = data.get_sunrise_sunset(now)
+        if now > sunrise and now < sunset:
+            pass
+        '{:0>2}:{:0>2}'.format(now.hour, now.minute)
+    return [('per check', best_time(check, 5000) * 1e6, 'us')]
+
+
+@benchmark
+def config(app):
+    """
+    Read the config from flash, as the old JSON file and as the binary record
+    """
+    from dawndoor import data
+    data.flush()
+    legacy = {
+        'location': data.get_location(),
+        'network': data.get_network(),
+        'door_config': data.get_door_config(),
+        'door_status': data.get_door_status()
+    }
+    json_fname = data.JSON_DB_FILE + '.bench'
+    with open(json_fname, 'w') as f:
+        json.dump(legacy, f)
+
+    def read_json():
+        with open(json_fname) as f:
+            json.load(f)['door_status']
+
+    def read_record():
+        data.reload()
+        data.get_location()
+
+    def read_field():
+        data.reload()
+        data.get_door_status()
+
+    results = [
+        ('JSON, whole file', best_time(read_json, 2000) * 1e6, 'us'),
+        ('binary, whole record', best_time(read_record, 2000) * 1e6, 'us'),
+        ('binary, one field', best_time(read_field, 2000) * 1e6, 'us'),
+        ('JSON size', os.stat(json_fname).st_size, 'bytes'),
+        ('binary size', os.stat(data.DB_FILE).st_size, 'bytes')
+    ]
+    os.remove(json_fname)
+    return results
+
+
+@benchmark
+def jsonify(app):
+    """
+    Send 1000 journal entries as JSON, streamed from a generator
+    """
+    from dawndoor.web import HTTPResponse, jsonify
+    entry = (1, 1717977600, 'open', 'schedule', 10)
+    writers = []
+
+    def send():
+        writer = StreamWriter(keep=False)
+        response = HTTPResponse(writer)
+        response.keep_alive = True
+        drive(jsonify(response, {'entries': (app.format_journal_entry(entry) for _ in range(1000)), 'next': None}))
+        drive(response.finish())
+        writers.append(writer)
+    per_call = best_time(send, 5)
+    return [
+        ('per response', per_call * 1e3, 'ms'),
+        ('response size', writers[-1].bytes, 'bytes'),
+        ('largest write', writers[-1].largest, 'bytes')
+    ]
+
+
+def static_etag(app, fname, gzip=False):
+    """
+    Return the ETag of a static file, or of its gzipped copy, from the manifest
+    """
+    entry = app.webapp.load_static_manifest()[fname]
+    return entry['gzip']['etag'] if gzip else entry['etag']
+
+
+@benchmark
+def web_handlers(app):
+    """
+    Make requests to the app's handlers, without a network
+    """
+    requests = [
+        ('GET /', b'GET / HTTP/1.1\r\nHost: dawndoor\r\nAccept: text/html\r\n\r\n'),
+        ('GET /status', b'GET /status HTTP/1.1\r\nHost: dawndoor\r\nAccept: */*\r\n\r\n'),
+        ('GET /door', b'GET /door HTTP/1.1\r\nHost: dawndoor\r\nAccept: */*\r\n\r\n'),
+        ('POST /location', b'POST /location HTTP/1.1\r\nHost: dawndoor\r\nContent-Type: application/json\r\n'
+                           b'Content-Length: 51\r\n\r\n{"latitude": 52, "longitude": 0, "timezone": "UTC"}'),
+        ('GET /static/app.css', b'GET /static/app.css HTTP/1.1\r\nHost: dawndoor\r\nAccept-Encoding: gzip\r\n\r\n'),
+        ('GET /static/app.css 304', b'GET /static/app.css HTTP/1.1\r\nHost: dawndoor\r\nAccept-Encoding: gzip\r\n'
+                                    b'If-None-Match: "%s"\r\n\r\n' % static_etag(app, 'app.css', gzip=True).encode()),
+        ('GET /missing', b'GET /missing HTTP/1.1\r\nHost: dawndoor\r\n\r\n')
+    ]
+    results = []
+    for name, raw in requests:
+        results.append((name, best_time(lambda: request(app.webapp, raw, keep=False), 200) * 1e6, 'us'))
+    return results
+
+
+@benchmark
+def display_time(app):
+    """
+    Run the display for an hour, with the door moving once
+    """
+    from machine import bus_stats
+
+    async def move_door():
+        await hostsim.uasyncio.sleep(1800)
+        await app.move_door('open', 'api')
+
+    transactions, sent = bus_stats()
+    start = time.perf_counter()
+    wakeups = hostsim.run_for(3600, app.display_time(), move_door())
+    elapsed = time.perf_counter() - start
+    transactions_after, sent_after = bus_stats()
+    return [
+        ('real time', elapsed * 1e3, 'ms'),
+        ('wake-ups', wakeups, ''),
+        ('I2C transactions', transactions_after - transactions, ''),
+        ('I2C bytes', sent_after - sent, '')
+    ]
+
+
+@benchmark
+def door_check(app):
+    """
+    Run the door for a week
+    """
+    from machine import Pin
+    from dawndoor import data
+    data.save_door_status('Closed')
+    relays = [Pin.pins[5], Pin.pins[4]]
+    changes = sum(relay.changes for relay in relays)
+    start = time.perf_counter()
+    wakeups = hostsim.run_for(7 * 24 * 3600, app.door_check())
+    elapsed = time.perf_counter() - start
+    return [
+        ('real time', elapsed * 1e3, 'ms'),
+        ('wake-ups', wakeups, ''),
+        ('door moves', (sum(relay.changes for relay in relays) - changes) // 2, '')
+    ]
+
+
+def main(names):
+    # Keep what the app prints out of the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        app, data_dir = setup()
+    try:
+        for func in BENCHMARKS:
+            if names and func.__name__ not in names:
+                continue
+            print('{}: {}'.format(func.__name__, func.__doc__.strip().splitlines()[0]))
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = func(app)
+            for label, value, unit in results:
+                print('  {:<24} {:>12.2f} {}'.format(label, value, unit).rstrip())
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# DawnDoor
+# --------
+# Copyright (C) 2021 Raoul Snyman
+#
+# Licensed under the MIT license, see LICENSE.txt for details
+"""
+Build step to run on the host before copying ``src/static`` onto the device.
+
+For every static file this writes a gzipped copy next to the original (when that is smaller), and a
+``manifest.json`` with a content hash to use as the ETag and the size of each file and of its gzipped copy. The web
+server uses the manifest to answer ``If-None-Match`` requests and to pick the gzipped copy, without having to open the
+files.
+"""
+import gzip
+import hashlib
+import json
+import os
+import sys
+
+MANIFEST = 'manifest.json'
+
+
+def compress_static(static_dir):
+    """
+    Compress the files in ``static_dir`` and write the manifest
+    """
+    manifest = {}
+    for fname in sorted(os.listdir(static_dir)):
+        path = os.path.join(static_dir, fname)
+        if fname == MANIFEST or fname.endswith('.gz') or not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as f:
+            content = f.read()
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        is_gzipped = len(compressed) < len(content)
+        if is_gzipped:
+            with open(path + '.gz', 'wb') as f:
+                f.write(compressed)
+        elif os.path.exists(path + '.gz'):
+            os.remove(path + '.gz')
+        manifest[fname] = {
+            'etag': hashlib.sha1(content).hexdigest()[:16],
+            'size': len(content),
+            # The gzipped copy needs its own ETag, as it is a different representation of the file
+            'gzip': {
+                'etag': hashlib.sha1(compressed).hexdigest()[:16],
+                'size': len(compressed)
+            } if is_gzipped else None
+        }
+        print('{}: {} -> {} bytes'.format(fname, len(content), len(compressed) if is_gzipped else len(content)))
+    with open(os.path.join(static_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, sort_keys=True)
+    return manifest
+
+
+if __name__ == '__main__':
+    compress_static(sys.argv[1] if len(sys.argv) > 1 else
+                    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'static'))
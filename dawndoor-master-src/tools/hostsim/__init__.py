@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# DawnDoor
+# --------
+# Copyright (C) 2021 Raoul Snyman
+#
+# Licensed under the MIT license, see LICENSE.txt for details
+"""
+A simulation of the DawnDoor hardware, so that the code in ``src`` can run on a PC.
+
+Call ``install()`` before importing anything from ``src``. It registers stand-ins for the MicroPython-only modules
+(``machine``, ``network``, ``framebuf``, ``ntptime``, ``esp``, ``micropython`` and ``uasyncio``), and points the
+``time`` module at a virtual clock which starts at ``hostsim.clock.DEFAULT_START``. The event loop from
+``uasyncio.get_event_loop()`` jumps the clock forward whenever every task is asleep, so ``run_for()`` can run the app's
+tasks for days in well under a second.
+"""
+import builtins
+import sys
+
+from hostsim import clock as _clock_module
+from hostsim import esp, framebuf, machine, micropython, network, ntptime, uasyncio
+from hostsim.clock import clock
+
+MODULES = {
+    'esp': esp,
+    'framebuf': framebuf,
+    'machine': machine,
+    'micropython': micropython,
+    'network': network,
+    'ntptime': ntptime,
+    'uasyncio': uasyncio
+}
+
+
+def install(start=None):
+    """
+    Register the stand-in modules and start the virtual clock. Returns the clock.
+    """
+    for name, module in MODULES.items():
+        sys.modules[name] = module
+    # MicroPython has const() as a builtin as well
+    builtins.const = micropython.const
+    _clock_module.patch_time()
+    if start is not None:
+        clock.reset(start)
+    return clock
+
+
+def uninstall():
+    """
+    Remove the stand-in modules and put the ``time`` module back
+    """
+    for name, module in MODULES.items():
+        if sys.modules.get(name) is module:
+            del sys.modules[name]
+    if getattr(builtins, 'const', None) is micropython.const:
+        del builtins.const
+    _clock_module.unpatch_time()
+
+
+def run_for(seconds, *coros):
+    """
+    Run coroutines as tasks for ``seconds`` of virtual time, then cancel them. Returns the number of times the event
+    loop had to sleep until a timer was due, which is the number of times a device would have woken up.
+    """
+    loop = uasyncio.get_event_loop()
+    wakeups = loop.wakeups
+    tasks = [loop.create_task(coro) for coro in coros]
+    loop.run_until_complete(uasyncio.sleep(seconds))
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(uasyncio.gather(*tasks, return_exceptions=True))
+    for task in tasks:
+        if not task.cancelled() and task.exception():
+            raise task.exception()
+    return loop.wakeups - wakeups
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# DawnDoor
+# --------
+# Copyright (C) 2021 Raoul Snyman
+#
+# Licensed under the MIT license, see LICENSE.txt for details
+"""
+A virtual clock, and the MicroPython flavour of the ``time`` module on top of it
+"""
+import calendar
+import time
+
+# 2024-06-10 00:00:00 UTC
+DEFAULT_START = 1717977600
+
+_gmtime = time.gmtime
+_originals = {}
+
+
+class Clock(object):
+    """
+    A clock that only moves when it is told to. The wall clock and the tick counter move together.
+    """
+
+    def __init__(self, start=DEFAULT_START):
+        self.reset(start)
+
+    def reset(self, start=DEFAULT_START):
+        """
+        Set the wall clock to ``start`` and the tick counter back to 0
+        """
+        self.start = start
+        self.elapsed = 0.0
+
+    def time(self):
+        """
+        Return the wall clock time, in seconds since the epoch
+        """
+        return self.start + self.elapsed
+
+    def monotonic(self):
+        """
+        Return the number of seconds since the clock was reset
+        """
+        return self.elapsed
+
+    def advance(self, seconds):
+        """
+        Move the clock forward
+        """
+        if seconds > 0:
+            self.elapsed += seconds
+
+
+clock = Clock()
+
+
+def localtime(secs=None):
+    """
+    MicroPython's localtime() and gmtime() are the same, and return an 8-tuple
+    """
+    return tuple(_gmtime(clock.time() if secs is None else secs))[:8]
+
+
+def mktime(timetuple):
+    """
+    MicroPython's mktime() is the inverse of localtime(), without any timezone
+    """
+    return calendar.timegm(tuple(timetuple[:6]) + (0, 0, 0))
+
+
+def sleep_ms(ms):
+    clock.advance(ms / 1000)
+
+
+def sleep_us(us):
+    clock.advance(us / 1000000)
+
+
+def ticks_ms():
+    return int(clock.monotonic() * 1000)
+
+
+def ticks_us():
+    return int(clock.monotonic() * 1000000)
+
+
+def ticks_diff(ticks1, ticks2):
+    return ticks1 - ticks2
+
+
+def ticks_add(ticks, delta):
+    return ticks + delta
+
+
+PATCHES = {
+    'time': lambda: int(clock.time()),
+    'localtime': localtime,
+    'gmtime': localtime,
+    'mktime': mktime,
+    'sleep_ms': sleep_ms,
+    'sleep_us': sleep_us,
+    'ticks_ms': ticks_ms,
+    'ticks_us': ticks_us,
+    'ticks_cpu': ticks_us,
+    'ticks_diff': ticks_diff,
+    'ticks_add': ticks_add
+}
+
+
+def patch_time():
+    """
+    Point the ``time`` module at the virtual clock. ``time.sleep``, ``time.monotonic`` and ``time.perf_counter`` are
+    left alone, so that asyncio and the benchmarks still work in real time.
+    """
+    for name, func in PATCHES.items():
+        if name not in _originals:
+            _originals[name] = getattr(time, name, None)
+        setattr(time, name, func)
+
+
+def unpatch_time():
+    """
+    Put the ``time`` module back the way it was
+    """
+    for name, func in _originals.items():
+        if func is None:
+            delattr(time, name)
+        else:
+            setattr(time, name, func)
+    _originals.clear()
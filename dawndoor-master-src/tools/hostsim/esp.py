@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# DawnDoor
+# --------
+# Copyright (C) 2021 Raoul Snyman
+#
+# Licensed under the MIT license, see LICENSE.txt for details
+"""
+A stand-in for MicroPython's ``esp`` module
+"""
+debug_level = None
+
+
+def osdebug(level):
+    global debug_level
+    debug_level = level
+
+
+def flash_size():
+    return 4 * 1024 * 1024
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# DawnDoor
+# --------
+# Copyright (C) 2021 Raoul Snyman
+#
+# Licensed under the MIT license, see LICENSE.txt for details
+"""
+A stand-in for MicroPython's ``machine`` module. Pins remember their value and call their interrupt handler, and the
+buses count how many transactions and bytes they are asked to send.
+"""
+
+# All the buses that have been created, so that their counters can be read without a reference to them
+buses = []
+
+
+class Pin(object):
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_DOWN = 1
+    PULL_UP = 2
+    IRQ_FALLING = 1
+    IRQ_RISING = 2
+
+    # The last Pin object created for each pin number
+    pins = {}
+
+    def __init__(self, id, mode=-1, pull=-1, value=None, **kwargs):
+        self.id = id
+        self._value = 0
+        self.changes = 0
+        self.handler = None
+        self.trigger = 0
+        self.init(mode, pull, value, **kwargs)
+        Pin.pins[id] = self
+
+    def init(self, mode=-1, pull=-1, value=None, **kwargs):
+        if mode != -1:
+            self.mode = mode
+        if pull != -1:
+            self.pull = pull
+        if value is not None:
+            self.value(value)
+
+    def value(self, value=None):
+        """
+        Get or set the value. Setting a different value calls the interrupt handler, if its trigger matches.
+        """
+        if value is None:
+            return self._value
+        value = 1 if value else 0
+        if value == self._value:
+            return
+        self._value = value
+        self.changes += 1
+        if self.handler and self.trigger & (Pin.IRQ_RISING if value else Pin.IRQ_FALLING):
+            self.handler(self)
+
+    __call__ = value
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    high = on
+    low = off
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, **kwargs):
+        self.handler = handler
+        self.trigger = trigger
+
+
+class _Bus(object):
+    """
+    Counts the transactions and bytes that go over a bus
+    """
+
+    def __init__(self):
+        self.reset_stats()
+        buses.append(self)
+
+    def reset_stats(self):
+        self.transactions = 0
+        self.bytes = 0
+
+    def _count(self, *bufs):
+        self.transactions += 1
+        for buf in bufs:
+            self.bytes += len(buf)
+
+
+class SoftI2C(_Bus):
+
+    def __init__(self, scl=None, sda=None, freq=400000, timeout=50000):
+        super().__init__()
+        self.scl = scl
+        self.sda = sda
+        self.freq = freq
+        self.devices = [0x3c]
+
+    def scan(self):
+        return list(self.devices)
+
+    def writeto(self, addr, buf, stop=True):
+        self._count(buf)
+        return len(buf)
+
+    def writevto(self, addr, vector, stop=True):
+        self._count(*vector)
+        return sum(len(buf) for buf in vector)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        self._count(b'')
+        return bytes(nbytes)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        self._count(b'')
+        buf[:] = bytes(len(buf))
+
+
+class I2C(SoftI2C):
+
+    def __init__(self, id=0, scl=None, sda=None, freq=400000, **kwargs):
+        super().__init__(scl, sda, freq)
+        self.id = id
+
+
+class SoftSPI(_Bus):
+
+    def __init__(self, baudrate=500000, polarity=0, phase=0, **kwargs):
+        super().__init__()
+        self.inits = 0
+        self.init(baudrate=baudrate, polarity=polarity, phase=phase)
+
+    def init(self, baudrate=500000, polarity=0, phase=0, **kwargs):
+        self.inits += 1
+        self.baudrate = baudrate
+        self.polarity = polarity
+        self.phase = phase
+
+    def write(self, buf):
+        self._count(buf)
+
+    def read(self, nbytes, write=0x00):
+        self._count(b'')
+        return bytes(nbytes)
+
+    def readinto(self, buf, write=0x00):
+        self._count(b'')
+        buf[:] = bytes(len(buf))
+
+    def write_readinto(self, write_buf, read_buf):
+        self._count(write_buf)
+        read_buf[:] = bytes(len(read_buf))
+
+
+class SPI(SoftSPI):
+
+    def __init__(self, id=1, baudrate=500000, polarity=0, phase=0, **kwargs):
+        self.id = id
+        super().__init__(baudrate, polarity, phase)
+
+
+def bus_stats():
+    """
+    Return the total number of transactions and bytes sent over all the buses
+    """
+    return sum(bus.transactions for bus in buses), sum(bus.bytes for bus in buses)
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state):
+    pass
+
+
+def freq(hz=None):
+    return 240000000
+
+
+def reset():
+    raise SystemExit('machine.reset()')
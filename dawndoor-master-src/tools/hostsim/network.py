@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# DawnDoor
+# --------
+# Copyright (C) 2021 Raoul Snyman
+#
+# Licensed under the MIT license, see LICENSE.txt for details
+"""
+A stand-in for MicroPython's ``network`` module. Every WLAN object for an interface shares the same state, like on the
+device. Connecting always succeeds straight away, unless ``can_connect`` is set to False.
+"""
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 1000
+STAT_CONNECTING = 1001
+STAT_GOT_IP = 1010
+
+# Whether connect() succeeds
+can_connect = True
+
+_interfaces = {}
+
+
+def reset():
+    """
+    Forget the state of all the interfaces
+    """
+    global can_connect
+    can_connect = True
+    _interfaces.clear()
+
+
+class WLAN(object):
+
+    def __init__(self, interface_id=STA_IF):
+        self.interface_id = interface_id
+        if interface_id not in _interfaces:
+            _interfaces[interface_id] = {
+                'active': False,
+                'connected': False,
+                'config': {'essid': '', 'password': ''},
+                'ifconfig': ('192.168.4.1', '255.255.255.0', '192.168.4.1', '192.168.4.1') if interface_id == AP_IF
+                else ('192.168.1.50', '255.255.255.0', '192.168.1.1', '192.168.1.1')
+            }
+        self._state = _interfaces[interface_id]
+
+    def active(self, is_active=None):
+        if is_active is None:
+            return self._state['active']
+        self._state['active'] = bool(is_active)
+        if not is_active:
+            self._state['connected'] = False
+
+    def connect(self, ssid=None, key=None, **kwargs):
+        if not self._state['active']:
+            raise OSError('Wifi Internal Error')
+        self._state['config']['essid'] = ssid
+        self._state['connected'] = can_connect
+
+    def disconnect(self):
+        self._state['connected'] = False
+
+    def isconnected(self):
+        if self.interface_id == AP_IF:
+            return self._state['active']
+        return self._state['active'] and self._state['connected']
+
+    def status(self, param=None):
+        if param is not None:
+            return 0
+        if self.isconnected():
+            return STAT_GOT_IP
+        return STAT_CONNECTING if self._state['active'] else STAT_IDLE
+
+    def scan(self):
+        return []
+
+    def ifconfig(self, config=None):
+        if config is not None:
+            self._state['ifconfig'] = tuple(config)
+            return
+        if self.interface_id == STA_IF and not self.isconnected():
+            return ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
+        return self._state['ifconfig']
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self._state['config'].get(args[0])
+        self._state['config'].update(kwargs)
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# DawnDoor
+# --------
+# Copyright (C) 2021 Raoul Snyman
+#
+# Licensed under the MIT license, see LICENSE.txt for details
+"""
+A stand-in for MicroPython's ``ntptime`` module. The virtual clock is always right, so setting the time only counts
+how often it happens.
+"""
+from hostsim.clock import clock
+
+host = 'pool.ntp.org'
+timeout = 1
+calls = 0
+
+
+def time():
+    return int(clock.time())
+
+
+def settime():
+    global calls
+    calls += 1
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# DawnDoor
+# --------
+# Copyright (C) 2021 Raoul Snyman
+#
+# Licensed under the MIT license, see LICENSE.txt for details
+"""
+In-memory streams with the uasyncio StreamReader and StreamWriter methods that the web server uses. Reading and writing
+never has to wait, so the generator-based web handlers can be run to completion without an event loop.
+"""
+import io
+
+from hostsim import uasyncio
+
+
+class StreamReader(object):
+    """
+    Reads from the given data. If ``wait`` is True, reading past the end waits forever, like a client that keeps the
+    connection open without sending anything, instead of returning nothing as if the client had closed it.
+    """
+
+    def __init__(self, data=b'', wait=False):
+        self.stream = io.BytesIO(data)
+        self.wait = wait
+
+    def _wait_if_empty(self, data):
+        if not data and self.wait:
+            yield from uasyncio.get_event_loop().create_future()
+
+    def readline(self):
+        line = self.stream.readline()
+        yield from self._wait_if_empty(line)
+        return line
+
+    def read(self, n=-1):
+        data = self.stream.read(n)
+        yield from self._wait_if_empty(data)
+        return data
+
+    def readexactly(self, n):
+        data = self.stream.read(n)
+        if len(data) < n:
+            raise EOFError()
+        return data
+        yield
+
+
+class StreamWriter(object):
+    """
+    Collects what is written, unless ``keep`` is False, in which case only the writes and bytes are counted.
+    ``largest`` is the size of the biggest single write.
+    """
+
+    def __init__(self, keep=True):
+        self.keep = keep
+        self.output = bytearray()
+        self.writes = 0
+        self.bytes = 0
+        self.largest = 0
+        self.closed = False
+
+    def awrite(self, buf, off=0, sz=-1):
+        if isinstance(buf, str):
+            buf = buf.encode()
+        if off or sz >= 0:
+            buf = buf[off:] if sz < 0 else buf[off:off + sz]
+        self.writes += 1
+        self.bytes += len(buf)
+        self.largest = max(self.largest, len(buf))
+        if self.keep:
+            self.output += buf
+        return
+        yield
+
+    def aclose(self):
+        self.closed = True
+        return
+        yield
+
+
+def drive(gen):
+    """
+    Run a generator-based handler to the end, and return its result. The handler must not need to wait for anything
+    other than these streams.
+    """
+    try:
+        while True:
+            if next(gen) is not None:
+                raise RuntimeError('The handler is waiting for something that is not a stream')
+    except StopIteration as e:
+        return e.value
+
+
+def request(app, raw, keep=True, wait=False):
+    """
+    Send a raw HTTP request to a WebApp, and return the StreamWriter with the response. The app is run on the event
+    loop, as it may wait with a timeout (see ``StreamReader`` for ``wait``).
+    """
+    writer = StreamWriter(keep)
+    uasyncio.run(uasyncio._run(app.handle(StreamReader(raw, wait), writer)))
+    return writer
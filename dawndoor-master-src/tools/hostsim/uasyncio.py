@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# DawnDoor
+# --------
+# Copyright (C) 2021 Raoul Snyman
+#
+# Licensed under the MIT license, see LICENSE.txt for details
+"""
+A stand-in for MicroPython's ``uasyncio``, which is CPython's asyncio running on the virtual clock. Whenever there is
+nothing to do until a timer is due, the clock jumps straight to that timer, so a day of sleeps takes no real time.
+
+``start_server`` serves real sockets with MicroPython's stream API (``awrite`` and ``aclose``), so that the web server
+can be run against a real client. It works on any event loop, including CPython's own.
+"""
+import asyncio
+import selectors
+import types
+from asyncio import *  # noqa: F401,F403
+
+from hostsim.clock import clock
+
+_loop = None
+
+
+class _VirtualSelector(object):
+    """
+    Wraps a real selector, and moves the virtual clock forward instead of waiting for a timeout
+    """
+
+    def __init__(self, selector):
+        self.selector = selector
+        self.wakeups = 0
+
+    def select(self, timeout=None):
+        events = self.selector.select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            return self.selector.select(None)
+        clock.advance(timeout)
+        self.wakeups += 1
+        return []
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+    """
+    An event loop on the virtual clock. ``wakeups`` is the number of times it has slept until a timer was due.
+    """
+
+    def __init__(self):
+        self._virtual_selector = _VirtualSelector(selectors.DefaultSelector())
+        super().__init__(self._virtual_selector)
+
+    def time(self):
+        return clock.monotonic()
+
+    @property
+    def wakeups(self):
+        return self._virtual_selector.wakeups
+
+
+def get_event_loop(runq_len=None, waitq_len=None):
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = VirtualEventLoop()
+        asyncio.set_event_loop(_loop)
+    return _loop
+
+
+def new_event_loop():
+    global _loop
+    _loop = None
+    return get_event_loop()
+
+
+def run(coro):
+    return get_event_loop().run_until_complete(coro)
+
+
+def sleep_ms(ms):
+    return asyncio.sleep(ms / 1000)
+
+
+@types.coroutine
+def _run(gen):
+    return (yield from gen)
+
+
+@types.coroutine
+def wait_for(aw, timeout):
+    """
+    The same as ``asyncio.wait_for``, except that like MicroPython's it can wait for a plain generator, and it can be
+    used with ``yield from`` in the generator-based web handlers
+    """
+    if isinstance(aw, types.GeneratorType):
+        aw = _run(aw)
+    return (yield from asyncio.wait_for(aw, timeout))
+
+
+class Stream(object):
+    """
+    MicroPython's ``uasyncio.Stream``, which is both the reader and the writer of a connection, on top of CPython's
+    asyncio streams
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @types.coroutine
+    def readline(self):
+        return (yield from self.reader.readline())
+
+    @types.coroutine
+    def read(self, n=-1):
+        return (yield from self.reader.read(n))
+
+    @types.coroutine
+    def readexactly(self, n):
+        try:
+            return (yield from self.reader.readexactly(n))
+        except asyncio.IncompleteReadError:
+            raise EOFError()
+
+    @types.coroutine
+    def awrite(self, buf, off=0, sz=-1):
+        if isinstance(buf, str):
+            buf = buf.encode()
+        if off or sz >= 0:
+            buf = buf[off:] if sz < 0 else buf[off:off + sz]
+        self.writer.write(buf)
+        yield from self.writer.drain()
+
+    @types.coroutine
+    def aclose(self):
+        self.writer.close()
+        yield from self.writer.wait_closed()
+
+
+def start_server(callback, host, port, backlog=5):
+    """
+    Serve connections on a real socket, calling ``callback(stream, stream)`` for each one, like MicroPython does. The
+    callback can be a coroutine function or a generator function, like ``WebApp.handle``.
+    """
+    async def connected(reader, writer):
+        stream = Stream(reader, writer)
+        result = callback(stream, stream)
+        if isinstance(result, types.GeneratorType):
+            result = _run(result)
+        await result
+    return asyncio.start_server(connected, host, port, backlog=backlog)
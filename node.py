@@ -1,33 +1,135 @@
-
-from machine import Pin, SoftI2C
+import gc
+import time
+from array import array
+from machine import Pin, SoftI2C, disable_irq, enable_irq
 import ssd1306
-from time import sleep
-import requests
-
-s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-s.bind(('', 80))
-s.listen(5)
-
-while True:
-    conn, addr = s.accept()
-    print('Got a connection from %s' % str(addr))
-    dataFromBS = conn.recv(1024)
-    dataFromBS = str(dataFromBS)
-    
-    # Display message on the OLED
-    displayMessage(dataFromBS)
-    ack.value(0)
-
-    if(getStatus() == "ACK"):
-        r = requests.get(BROADCAST_SERVER_URL+"/ack?status=true")
-        print(r.content)
-
-    response = getStatus()
-    conn.send('HTTP/1.1 200 OK\n')
-    conn.send('Content-Type: text/html\n')
-    conn.send('Connection: close\n\n')
-    conn.sendall(response)
-    conn.close()
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+from web import HTTPError, WebApp, start_response, unquote_plus
+
+MESSAGE_DWELL = 2
+ACK_DEBOUNCE_MS = 200
+ACK_RETRY_MAX = 60
+ACK_TIMEOUT = 10
+webapp = WebApp()
+
+
+class MessageDisplay(object):
+    """
+    Keeps the OLED set up between pages, and queues messages to be shown on it
+    """
+
+    def __init__(self, i2c, width=128, height=64, queue_size=4):
+        self.oled = ssd1306.SSD1306_I2C(width, height, i2c)
+        self.columns = width // 8
+        self.rows = height // 8
+        self.queue_size = queue_size
+        self.queue = []
+        self.lines = [''] * self.rows
+        # Set when a message is posted, so that show_messages() can sleep while the queue is empty
+        self.posted = asyncio.Event()
+
+    def post(self, message):
+        """
+        Add a message to the queue, dropping the oldest one if the queue is full
+        """
+        if len(self.queue) >= self.queue_size:
+            self.queue.pop(0)
+        self.queue.append(message)
+        self.posted.set()
+
+    def wrap(self, message):
+        """
+        Split a message into lines that fit on the display
+        """
+        lines = []
+        for paragraph in message.split('\n'):
+            while len(lines) < self.rows:
+                lines.append(paragraph[:self.columns])
+                paragraph = paragraph[self.columns:]
+                if not paragraph:
+                    break
+        while len(lines) < self.rows:
+            lines.append('')
+        return lines[:self.rows]
+
+    def render(self):
+        """
+        Show the next message in the queue, redrawing only the lines that are different from what is on the display
+        """
+        if not self.queue:
+            return False
+        lines = self.wrap(self.queue.pop(0))
+        changed = False
+        for row, line in enumerate(lines):
+            if line == self.lines[row]:
+                continue
+            self.oled.framebuf.fill_rect(0, row * 8, self.oled.width, 8, 0)
+            self.oled.text(line, 0, row * 8)
+            self.lines[row] = line
+            changed = True
+        if changed:
+            self.oled.show()
+        return True
+
+
+class AckButton(object):
+    """
+    Records presses of the ACK button from a pin interrupt into a ring buffer, so that none are missed between pages
+    """
+
+    def __init__(self, pin, size=8, debounce_ms=ACK_DEBOUNCE_MS):
+        self.pin = pin
+        self.size = size
+        self.debounce_ms = debounce_ms
+        # The press times (in ticks_ms) are kept in a preallocated array, because the interrupt handler can't
+        # allocate memory
+        self.presses = array('L', [0] * size)
+        self.head = 0
+        self.count = 0
+        self.last_press = time.ticks_ms() - debounce_ms
+        # Set by the interrupt handler, so that push_acks() can sleep until there is a press to send
+        self.pressed = asyncio.ThreadSafeFlag()
+        pin.irq(trigger=Pin.IRQ_RISING, handler=self.on_press)
+
+    def on_press(self, pin):
+        """
+        Interrupt handler, which timestamps and debounces a press
+        """
+        now = time.ticks_ms()
+        if time.ticks_diff(now, self.last_press) < self.debounce_ms:
+            return
+        self.last_press = now
+        self.presses[(self.head + self.count) % self.size] = now
+        if self.count < self.size:
+            self.count += 1
+        else:
+            # The buffer is full, so drop the oldest press
+            self.head = (self.head + 1) % self.size
+        self.pressed.set()
+
+    def peek(self):
+        """
+        Return the time of the oldest press that hasn't been sent yet, or None
+        """
+        irq_state = disable_irq()
+        press = self.presses[self.head] if self.count else None
+        enable_irq(irq_state)
+        return press
+
+    def pop(self):
+        """
+        Remove the oldest press, once it has been sent
+        """
+        irq_state = disable_irq()
+        if self.count:
+            self.head = (self.head + 1) % self.size
+            self.count -= 1
+        enable_irq(irq_state)
 
 
 def getStatus():
@@ -37,15 +139,141 @@ def getStatus():
         ack_state="WAIT"
     return ack_state
 
-def displayMessage(content):
+
+def parse_url(url):
+    """
+    Split a URL into host, port and path
+    """
+    host = url.split('://', 1)[-1]
+    path = '/'
+    if '/' in host:
+        host, path = host.split('/', 1)
+        path = '/' + path
+    port = 80
+    if ':' in host:
+        host, port = host.split(':', 1)
+        port = int(port)
+    return host, port, path
+
+
+async def http_get(url):
+    """
+    Make a GET request without blocking the event loop, and return the status line
+    """
+    host, port, path = parse_url(url)
+    reader, writer = await asyncio.open_connection(host, port)
     try:
-        i2c = SoftI2C(scl=Pin(5), sda=Pin(4))
-        oled_width = 128
-        oled_height = 64
-        oled = ssd1306.SSD1306_I2C(oled_width, oled_height, i2c)
-        oled.text('{content}', 0, 0)
-        oled.show()
-        return "Successfully Displayed"
-    except Exception as e:
-        print(e)
-        return "OLED Failure"
\ No newline at end of file
+        await writer.awrite('GET %s HTTP/1.0\r\nHost: %s\r\n\r\n' % (path, host))
+        status_line = await reader.readline()
+    finally:
+        await writer.aclose()
+    return status_line
+
+
+async def push_acks():
+    """
+    Send each ACK button press to the broadcaster as soon as it happens, retrying with an increasing delay if the
+    broadcaster can't be reached or doesn't answer within ACK_TIMEOUT seconds
+    """
+    retry_delay = 1
+    while True:
+        press = ack_button.peek()
+        if press is None:
+            await ack_button.pressed.wait()
+            continue
+        age = time.ticks_diff(time.ticks_ms(), press)
+        try:
+            status_line = await asyncio.wait_for(http_get(BROADCAST_SERVER_URL + '/ack?status=true&age=%d' % age),
+                                                 ACK_TIMEOUT)
+            if status_line.split()[1][:1] != b'2':
+                raise OSError(status_line)
+        except Exception as e:
+            print('ACK failed, retrying in %ds: %s' % (retry_delay, e))
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, ACK_RETRY_MAX)
+            continue
+        ack_button.pop()
+        retry_delay = 1
+
+
+def read_body(request):
+    """
+    Read the whole body of a request, as given by the Content-Length header, into a buffer of that size. Bodies bigger
+    than the app's ``max_body`` are rejected with a 413 without being read.
+    """
+    size = int(request.headers.get(b'Content-Length', 0))
+    if size > request.max_body:
+        raise HTTPError('413')
+    body = bytearray(size)
+    received = 0
+    while received < size:
+        chunk = yield from request.reader.read(size - received)
+        if not chunk:
+            return body[:received]
+        body[received:received + len(chunk)] = chunk
+        received += len(chunk)
+    return body
+
+
+@webapp.route('/', method='GET', headers=(b'Content-Length',))
+@webapp.route('/', method='POST', headers=(b'Content-Length',))
+def receive_page(request, response):
+    """
+    Receive a page from the broadcaster and show it on the display. The message is the body of the request, or the
+    query string if there is no body.
+    """
+    body = yield from read_body(request)
+    message = str(body, 'utf-8') if body else unquote_plus(request.qs)
+    print('Got a page: %s' % message)
+    if display:
+        display.post(message)
+    yield from start_response(response, 'text/plain')
+    yield from response.awrite(getStatus())
+
+
+@webapp.route('/status', method='GET', headers='skip')
+def get_status(request, response):
+    """
+    Return the state of the ACK button
+    """
+    yield from start_response(response, 'text/plain')
+    yield from response.awrite(getStatus())
+
+
+async def show_messages():
+    """
+    Show each queued message for at least MESSAGE_DWELL seconds, so that a burst of pages can be read, and wait for
+    the next page once the queue is empty
+    """
+    if not display:
+        return
+    while True:
+        if display.render():
+            await asyncio.sleep(MESSAGE_DWELL)
+        else:
+            display.posted.clear()
+            await display.posted.wait()
+
+
+def main():
+    """
+    Set up the tasks and start the event loop
+    """
+    loop = asyncio.get_event_loop()
+    loop.create_task(show_messages())
+    loop.create_task(push_acks())
+    loop.create_task(asyncio.start_server(webapp.handle, '0.0.0.0', 80))
+    gc.collect()
+    loop.run_forever()
+
+
+# Set up the display once, rather than for every page
+try:
+    display = MessageDisplay(SoftI2C(scl=Pin(5), sda=Pin(4)))
+except Exception as e:
+    print(e)
+    display = None
+
+ack_button = AckButton(ack)
+
+main()
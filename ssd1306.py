@@ -29,14 +29,27 @@ class SSD1306:
         self.height = height
         self.external_vcc = external_vcc
         self.pages = self.height // 8
-        # Note the subclass must initialize self.framebuf to a framebuffer.
+        # Note the subclass must initialize self.framebuf to a framebuffer,
+        # and self.offset to the position of the framebuffer in self.buffer.
         # This is necessary because the underlying data buffer is different
         # between I2C and SPI implementations (I2C needs an extra byte).
+        # The same goes for self.cmd_buf and self.cmd_offset, the buffer that
+        # command sequences are packed into before they are sent.
+        # A copy of what was last sent to the display is kept, a page at a
+        # time, so that show() only needs to send the parts of the
+        # framebuffer that changed. Each page is copied into the scratch
+        # buffer to compare it with the copy, without allocating.
+        self.shadow = [bytearray(self.width) for _ in range(self.pages)]
+        self.scratch = bytearray(self.width)
+        self.stale = True
+        self.window = bytearray(6)
+        self.window[0] = SET_COL_ADDR
+        self.window[3] = SET_PAGE_ADDR
         self.poweron()
         self.init_display()
 
     def init_display(self):
-        for cmd in (
+        self.write_cmds((
             SET_DISP | 0x00, # off
             # address setting
             SET_MEM_ADDR, 0x00, # horizontal
@@ -57,35 +70,76 @@ class SSD1306:
             SET_NORM_INV, # not inverted
             # charge pump
             SET_CHARGE_PUMP, 0x10 if self.external_vcc else 0x14,
-            SET_DISP | 0x01): # on
-            self.write_cmd(cmd)
+            SET_DISP | 0x01)) # on
         self.fill(0)
-        self.show()
+        self.show(full=True)
+
+    def write_cmds(self, cmds):
+        # Pack the commands into the command buffer and send them in as few
+        # transactions as possible (normally one)
+        buf = self.cmd_buf
+        start = self.cmd_offset
+        end = start
+        for cmd in cmds:
+            if end == len(buf):
+                self.write_cmd_buf(end)
+                end = start
+            buf[end] = cmd
+            end += 1
+        if end > start:
+            self.write_cmd_buf(end)
 
     def poweroff(self):
         self.write_cmd(SET_DISP | 0x00)
 
     def contrast(self, contrast):
-        self.write_cmd(SET_CONTRAST)
-        self.write_cmd(contrast)
+        self.write_cmds((SET_CONTRAST, contrast))
 
     def invert(self, invert):
-        self.write_cmd(SET_NORM_INV | (invert & 1))
+        self.write_cmds((SET_NORM_INV | (invert & 1),))
 
-    def show(self):
-        x0 = 0
-        x1 = self.width - 1
+    def set_window(self, x0, x1, page0, page1):
+        x_offset = 0
         if self.width == 64:
             # displays with width of 64 pixels are shifted by 32
-            x0 += 32
-            x1 += 32
-        self.write_cmd(SET_COL_ADDR)
-        self.write_cmd(x0)
-        self.write_cmd(x1)
-        self.write_cmd(SET_PAGE_ADDR)
-        self.write_cmd(0)
-        self.write_cmd(self.pages - 1)
-        self.write_framebuf()
+            x_offset = 32
+        window = self.window
+        window[1] = x0 + x_offset
+        window[2] = x1 + x_offset
+        window[4] = page0
+        window[5] = page1
+        self.write_cmds(window)
+
+    def show(self, full=False):
+        width = self.width
+        data = memoryview(self.buffer)[self.offset:]
+        if full or self.stale:
+            self.set_window(0, width - 1, 0, self.pages - 1)
+            self.write_framebuf()
+            for page in range(self.pages):
+                self.shadow[page][:] = data[page * width:(page + 1) * width]
+            self.stale = False
+            return
+        # Only send the columns between the first and last changed byte of
+        # each page that has changed since the last call
+        scratch = self.scratch
+        for page in range(self.pages):
+            shadow = self.shadow[page]
+            scratch[:] = data[page * width:(page + 1) * width]
+            if scratch == shadow:
+                continue
+            start = 0
+            end = width
+            while scratch[start] == shadow[start]:
+                start += 1
+            while scratch[end - 1] == shadow[end - 1]:
+                end -= 1
+            self.set_window(start, end - 1, page, page)
+            self.write_data(data[page * width + start:page * width + end])
+            # The scratch page is now what is on the display, so swap it with
+            # the old copy rather than copying it back
+            self.shadow[page] = scratch
+            scratch = self.scratch = shadow
 
     def fill(self, col):
         self.framebuf.fill(col)
@@ -99,6 +153,9 @@ class SSD1306:
     def text(self, string, x, y, col=1):
         self.framebuf.text(string, x, y, col)
 
+    def blit(self, fbuf, x, y, key=-1):
+        self.framebuf.blit(fbuf, x, y, key)
+
 
 class SSD1306_I2C(SSD1306):
     def __init__(self, width, height, i2c, addr=0x3c, external_vcc=False):
@@ -112,7 +169,13 @@ class SSD1306_I2C(SSD1306):
         # buffer).
         self.buffer = bytearray(((height // 8) * width) + 1)
         self.buffer[0] = 0x40  # Set first byte of data buffer to Co=0, D/C=1
+        self.offset = 1
         self.framebuf = framebuf.FrameBuffer1(memoryview(self.buffer)[1:], width, height)
+        # Command sequences are sent behind a single Co=0, D/C#=0 control
+        # byte, which means that all of the following bytes are commands
+        self.cmd_buf = bytearray(33)
+        self.cmd_buf[0] = 0x00
+        self.cmd_offset = 1
         super().__init__(width, height, external_vcc)
 
     def write_cmd(self, cmd):
@@ -120,11 +183,19 @@ class SSD1306_I2C(SSD1306):
         self.temp[1] = cmd
         self.i2c.writeto(self.addr, self.temp)
 
+    def write_cmd_buf(self, length):
+        self.i2c.writeto(self.addr, memoryview(self.cmd_buf)[:length])
+
     def write_framebuf(self):
         # Blast out the frame buffer using a single I2C transaction to support
         # hardware I2C interfaces.
         self.i2c.writeto(self.addr, self.buffer)
 
+    def write_data(self, buf):
+        # Send part of the frame buffer, prefixed with the data control byte
+        # in the same transaction
+        self.i2c.writevto(self.addr, (b'\x40', buf))
+
     def poweron(self):
         pass
 
@@ -140,23 +211,44 @@ class SSD1306_SPI(SSD1306):
         self.res = res
         self.cs = cs
         self.buffer = bytearray((height // 8) * width)
+        self.offset = 0
         self.framebuf = framebuf.FrameBuffer1(self.buffer, width, height)
+        self.cmd_buf = bytearray(32)
+        self.cmd_offset = 0
+        self.bus_ready = False
         super().__init__(width, height, external_vcc)
 
+    def bus_changed(self):
+        # Call this when something else has reconfigured the SPI bus, so
+        # that it gets initialised again before the next write
+        self.bus_ready = False
+
+    def init_bus(self):
+        if not self.bus_ready:
+            self.spi.init(baudrate=self.rate, polarity=0, phase=0)
+            self.bus_ready = True
+
     def write_cmd(self, cmd):
-        self.spi.init(baudrate=self.rate, polarity=0, phase=0)
+        self.cmd_buf[0] = cmd
+        self.write_cmd_buf(1)
+
+    def write_cmd_buf(self, length):
+        self.init_bus()
         self.cs.high()
         self.dc.low()
         self.cs.low()
-        self.spi.write(bytearray([cmd]))
+        self.spi.write(memoryview(self.cmd_buf)[:length])
         self.cs.high()
 
     def write_framebuf(self):
-        self.spi.init(baudrate=self.rate, polarity=0, phase=0)
+        self.write_data(self.buffer)
+
+    def write_data(self, buf):
+        self.init_bus()
         self.cs.high()
         self.dc.high()
         self.cs.low()
-        self.spi.write(self.buffer)
+        self.spi.write(buf)
         self.cs.high()
 
     def poweron(self):
@@ -16,6 +16,54 @@ try:
 except ImportError:
     import errno
 
+try:
+    import uos as os
+except ImportError:
+    import os
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+
+# Headers that are always kept, because they are needed to reuse the connection
+CONNECTION_HEADERS = (b'Content-Length', b'Connection')
+# Request bodies are read this many bytes at a time
+BODY_CHUNK_SIZE = 128
+# How much of a JSON response is buffered before it is written
+JSON_BUFFER_SIZE = 512
+# Templates are scanned for placeholders this many bytes at a time, and anything between {{ and }} that is longer
+# than MAX_PLACEHOLDER is left as it is
+TEMPLATE_CHUNK_SIZE = 256
+MAX_PLACEHOLDER = 64
+
+
+class HTTPError(Exception):
+    """
+    An error that is sent back to the client as a response with the given status
+    """
+
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+def compile_headers(names):
+    """
+    Turn a list of header names into the dict that ``WebApp.read_headers`` matches header lines against, which maps the
+    lower case name to the name as given. The headers needed to reuse the connection are always included.
+    """
+    wanted = {}
+    for name in tuple(names) + CONNECTION_HEADERS:
+        wanted[name.lower()] = name
+    return wanted
+
 
 def unquote_plus(string):
     string = string.replace('+', ' ')
@@ -41,6 +89,149 @@ def parse_qs(string):
     return params
 
 
+class FormParser(object):
+    """
+    Decodes an application/x-www-form-urlencoded body as it arrives. Each byte is percent-decoded once, straight into
+    a bytearray, and escapes may be split across chunks.
+    """
+
+    def __init__(self):
+        self.form = {}
+        self.key = None
+        self.buf = bytearray()
+        self.hex_digits = -1
+        self.hex_value = 0
+
+    def feed(self, data):
+        buf = self.buf
+        for byte in data:
+            if self.hex_digits >= 0:
+                if 0x30 <= byte <= 0x39:
+                    digit = byte - 0x30
+                elif 0x61 <= byte | 0x20 <= 0x66:
+                    digit = (byte | 0x20) - 0x57
+                else:
+                    raise HTTPError('400')
+                self.hex_value = (self.hex_value << 4) | digit
+                self.hex_digits -= 1
+                if not self.hex_digits:
+                    buf.append(self.hex_value)
+                    self.hex_digits = -1
+            elif byte == 0x25:  # %
+                self.hex_digits = 2
+                self.hex_value = 0
+            elif byte == 0x2b:  # +
+                buf.append(0x20)
+            elif byte == 0x3d and self.key is None:  # =
+                self.key = self.decode(buf)
+                buf = self.buf = bytearray()
+            elif byte == 0x26:  # &
+                self.end_pair()
+                buf = self.buf
+            else:
+                buf.append(byte)
+
+    def decode(self, buf):
+        try:
+            return str(buf, 'utf-8')
+        except UnicodeError:
+            raise HTTPError('400')
+
+    def end_pair(self):
+        if self.hex_digits >= 0:
+            raise HTTPError('400')
+        if self.key is None:
+            key, value = self.decode(self.buf), True
+        else:
+            key, value = self.key, self.decode(self.buf)
+        if key:
+            if key in self.form:
+                if not isinstance(self.form[key], list):
+                    self.form[key] = [self.form[key]]
+                self.form[key].append(value)
+            else:
+                self.form[key] = value
+        self.key = None
+        self.buf = bytearray()
+
+    def close(self):
+        self.end_pair()
+        return self.form
+
+
+class JSONParser(object):
+    """
+    Collects a JSON body as it arrives, and decodes it into a dict at the end
+    """
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def feed(self, data):
+        self.buf.extend(data)
+
+    def close(self):
+        try:
+            form = json.loads(self.buf)
+        except ValueError:
+            raise HTTPError('400')
+        if not isinstance(form, dict):
+            raise HTTPError('400')
+        return form
+
+
+def compile_template(fname):
+    """
+    Scan a template for ``{{ name }}`` placeholders. Returns a list of segments, each of which is either the
+    (offset, length) of some literal text in the file, or the name of a placeholder. Only TEMPLATE_CHUNK_SIZE bytes of
+    the file are in memory at a time, and the literal text is not kept.
+    """
+    segments = []
+    literal_start = 0
+    # The part of the file that hasn't been scanned yet, and where it starts in the file
+    pending = b''
+    pending_offset = 0
+    with open(fname, 'rb') as f:
+        while True:
+            chunk = f.read(TEMPLATE_CHUNK_SIZE)
+            pending += chunk
+            pos = 0
+            while True:
+                start = pending.find(b'{{', pos)
+                if start < 0:
+                    break
+                end = pending.find(b'}}', start + 2)
+                if end < 0 and len(pending) - 1 - start <= MAX_PLACEHOLDER:
+                    # The end of the placeholder might be in the next chunk
+                    break
+                if end < 0 or end - start > MAX_PLACEHOLDER:
+                    pos = start + 2
+                    continue
+                if pending_offset + start > literal_start:
+                    segments.append((literal_start, pending_offset + start - literal_start))
+                segments.append(str(pending[start + 2:end].strip(), 'utf-8'))
+                pending_offset += end + 2
+                pending = pending[end + 2:]
+                literal_start = pending_offset
+                pos = 0
+            if not chunk:
+                break
+            # Only keep what could be the start of a placeholder
+            start = pending.find(b'{{', pos)
+            if start < 0:
+                start = len(pending) - 1 if pending.endswith(b'{') else len(pending)
+            pending_offset += start
+            pending = pending[start:]
+    if pending_offset + len(pending) > literal_start:
+        segments.append((literal_start, pending_offset + len(pending) - literal_start))
+    return segments
+
+
+def escape_html(string):
+    return string.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;') \
+        .replace("'", '&#39;')
+
+
 def get_mime_type(fname):
     # Provide minimal detection of important file
     # types to keep browsers happy
@@ -48,6 +239,8 @@ def get_mime_type(fname):
         return 'text/html'
     if fname.endswith('.css'):
         return 'text/css'
+    if fname.endswith('.js'):
+        return 'application/javascript'
     if fname.endswith('.svg'):
         return 'image/svg+xml'
     if fname.endswith('.png'):
@@ -59,55 +252,265 @@ def get_mime_type(fname):
     return 'application/octet-stream'
 
 
-def sendstream(writer, file_):
-    buf = bytearray(64)
+def sendstream(writer, file_, buf=None):
+    if buf is None:
+        buf = bytearray(64)
+    view = memoryview(buf)
     while True:
-        line = file_.readinto(buf)
-        if not line:
+        size = file_.readinto(buf)
+        if not size:
             break
-        yield from writer.awrite(buf, 0, line)
+        yield from writer.awrite(view[:size])
 
 
-def jsonify(writer, pydict):
-    try:
-        import ujson as json
-    except ImportError:
-        import json
-    yield from start_response(writer, 'application/json')
-    yield from writer.awrite(json.dumps(pydict))
+def add_content_length(headers, length):
+    """
+    Return a copy of the headers with a Content-Length header added
+    """
+    if not headers:
+        return {'Content-Length': str(length)}
+    if isinstance(headers, dict):
+        headers = dict(headers)
+        headers['Content-Length'] = str(length)
+        return headers
+    header = 'Content-Length: %d\r\n' % length
+    return headers + (header.encode() if isinstance(headers, bytes) else header)
+
+
+def has_content_length(headers):
+    if not headers:
+        return False
+    if isinstance(headers, bytes):
+        return b'Content-Length' in headers
+    return 'Content-Length' in headers
+
+
+class JSONStream(object):
+    """
+    Encodes an object as JSON and writes it to a stream in pieces, through a buffer of ``buffer_size`` bytes. Dicts,
+    lists, tuples and any other iterable (such as a generator) are encoded one item at a time, so only the buffer and
+    the item being encoded are ever in memory. The response is started with ``start_response`` just before the first
+    write.
+    """
+
+    def __init__(self, writer, buffer_size=JSON_BUFFER_SIZE, content_type='application/json'):
+        self.writer = writer
+        self.content_type = content_type
+        self.buf = bytearray(buffer_size)
+        self.length = 0
+        self.started = False
+
+    def encode(self, obj):
+        if obj is None or isinstance(obj, (str, int, float, bool)):
+            yield from self.write(json.dumps(obj))
+        elif isinstance(obj, dict):
+            separator = b'{'
+            for key, value in obj.items():
+                yield from self.write(separator)
+                yield from self.write(json.dumps(str(key)))
+                yield from self.write(b': ')
+                yield from self.encode(value)
+                separator = b', '
+            yield from self.write(b'{}' if separator == b'{' else b'}')
+        else:
+            separator = b'['
+            for item in obj:
+                yield from self.write(separator)
+                yield from self.encode(item)
+                separator = b', '
+            yield from self.write(b'[]' if separator == b'[' else b']')
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        size = len(data)
+        if self.length + size > len(self.buf):
+            yield from self.flush()
+            if size > len(self.buf):
+                # Bigger than the buffer, so send it as it is
+                yield from self.send(data)
+                return
+        self.buf[self.length:self.length + size] = data
+        self.length += size
+
+    def flush(self):
+        if self.length:
+            yield from self.send(memoryview(self.buf)[:self.length])
+            self.length = 0
+
+    def send(self, data):
+        if not self.started:
+            self.started = True
+            yield from start_response(self.writer, self.content_type)
+        yield from self.writer.awrite(data)
+
+
+def jsonify(writer, obj, buffer_size=JSON_BUFFER_SIZE):
+    """
+    Send an object as a JSON response. If it fits in ``buffer_size`` bytes it is sent with a Content-Length, otherwise
+    it is streamed as it is encoded (see ``JSONStream``), so memory use stays the same however big the response is.
+    """
+    stream = JSONStream(writer, buffer_size)
+    yield from stream.encode(obj)
+    if stream.started:
+        yield from stream.flush()
+        return
+    body = memoryview(stream.buf)[:stream.length]
+    yield from start_response(writer, 'application/json', headers=add_content_length(None, len(body)))
+    yield from writer.awrite(body)
 
 
 def start_response(writer, content_type='text/html', status='200', headers=None):
-    yield from writer.awrite('HTTP/1.0 %s NA\r\n' % status)
+    # Responses on a keep-alive connection (see HTTPResponse) are sent as HTTP/1.1, and if they don't say how long
+    # they are, they need to be chunked so that the client can tell where they end
+    keep_alive = getattr(writer, 'keep_alive', False)
+    chunked = keep_alive and not has_content_length(headers)
+    yield from writer.awrite('HTTP/1.%d %s NA\r\n' % (1 if keep_alive else 0, status))
     yield from writer.awrite('Content-Type: ')
     yield from writer.awrite(content_type)
+    if chunked:
+        yield from writer.awrite('\r\nTransfer-Encoding: chunked')
     if not headers:
         yield from writer.awrite('\r\n\r\n')
-        return
-    yield from writer.awrite('\r\n')
-    if isinstance(headers, bytes) or isinstance(headers, str):
-        yield from writer.awrite(headers)
     else:
-        for k, v in headers.items():
-            yield from writer.awrite(k)
-            yield from writer.awrite(': ')
-            yield from writer.awrite(v)
-            yield from writer.awrite('\r\n')
-    yield from writer.awrite('\r\n')
+        yield from writer.awrite('\r\n')
+        if isinstance(headers, bytes) or isinstance(headers, str):
+            yield from writer.awrite(headers)
+        else:
+            for k, v in headers.items():
+                yield from writer.awrite(k)
+                yield from writer.awrite(': ')
+                yield from writer.awrite(v)
+                yield from writer.awrite('\r\n')
+        yield from writer.awrite('\r\n')
+    if chunked:
+        writer.chunked = True
 
 
 def http_error(writer, status):
-    yield from start_response(writer, status=status)
+    yield from start_response(writer, status=status, headers=add_content_length(None, len(status)))
     yield from writer.awrite(status)
 
 
+class HTTPResponse(object):
+    """
+    Wraps the stream writer of a keep-alive connection, and sends the body of responses without a Content-Length
+    header using chunked transfer encoding
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.keep_alive = True
+        self.chunked = False
+
+    def awrite(self, buf, off=0, sz=-1):
+        if not self.chunked:
+            yield from self.writer.awrite(buf, off, sz)
+            return
+        if isinstance(buf, str):
+            buf = buf.encode()
+        if sz == -1:
+            sz = len(buf) - off
+        if not sz:
+            # An empty chunk marks the end of the response
+            return
+        yield from self.writer.awrite('%x\r\n' % sz)
+        yield from self.writer.awrite(buf, off, sz)
+        yield from self.writer.awrite('\r\n')
+
+    def finish(self):
+        """
+        End the current response
+        """
+        if self.chunked:
+            self.chunked = False
+            yield from self.writer.awrite('0\r\n\r\n')
+
+    def aclose(self):
+        yield from self.writer.aclose()
+
+
+class EventStream(object):
+    """
+    Pushes Server-Sent Events to connected browsers. Use ``handle`` as the handler of a route, and ``publish`` to send
+    an event. At most ``max_subscribers`` browsers can be connected at once (any more get a 503), and only the latest
+    event of each type is kept for a subscriber that hasn't caught up yet, so memory use stays bounded.
+    """
+
+    def __init__(self, max_subscribers=2, keepalive=30):
+        self.max_subscribers = max_subscribers
+        self.keepalive = keepalive
+        self.subscribers = []
+
+    def publish(self, event, data):
+        """
+        Send an event to all the subscribers. ``data`` is serialized to JSON once, however many subscribers there are.
+        """
+        if not self.subscribers:
+            return
+        message = 'event: %s\ndata: %s\n\n' % (event, json.dumps(data))
+        for pending, ready in self.subscribers:
+            pending[event] = message
+            ready.set()
+
+    def handle(self, req, writer):
+        if len(self.subscribers) >= self.max_subscribers:
+            yield from http_error(writer, '503')
+            return
+        if isinstance(writer, HTTPResponse):
+            # The stream lasts until the browser goes away, so the connection can't be reused
+            writer.keep_alive = False
+        subscriber = ({}, asyncio.Event())
+        pending, ready = subscriber
+        self.subscribers.append(subscriber)
+        try:
+            yield from start_response(writer, 'text/event-stream', headers={'Cache-Control': 'no-cache'})
+            while True:
+                try:
+                    yield from asyncio.wait_for(ready.wait(), self.keepalive)
+                except asyncio.TimeoutError:
+                    # Send a comment now and then, so that the browser and any proxies know the stream is still alive
+                    yield from writer.awrite(':\n\n')
+                    continue
+                ready.clear()
+                while pending:
+                    event, message = pending.popitem()
+                    yield from writer.awrite(message)
+        finally:
+            self.subscribers.remove(subscriber)
+
+
 class HTTPRequest(object):
 
-    def read_form_data(self):
-        size = int(self.headers[b'Content-Length'])
-        data = yield from self.reader.read(size)
-        form = parse_qs(data.decode())
-        self.form = form
+    def __init__(self):
+        self.body_size = 0
+        self.max_body = 1024
+
+    def read_form_data(self, max_size=None):
+        """
+        Read and decode the body of the request into ``self.form``, BODY_CHUNK_SIZE bytes at a time. URL-encoded and
+        JSON bodies are supported. A body that starts with '{' is decoded as JSON whatever its Content-Type, because
+        browsers send fetch() string bodies as text/plain. Bodies bigger than ``max_size`` (by default the app's
+        ``max_body``) are rejected with a 413 without being read.
+        """
+        size = int(self.headers.get(b'Content-Length', 0))
+        if size > (max_size or self.max_body):
+            raise HTTPError('413')
+        content_type = self.headers.get(b'Content-Type', b'')
+        parser = None
+        while size > 0:
+            chunk = yield from self.reader.read(min(size, BODY_CHUNK_SIZE))
+            if not chunk:
+                break
+            size -= len(chunk)
+            self.body_size = size
+            if parser is None:
+                if b'json' in content_type or chunk.lstrip()[:1] == b'{':
+                    parser = JSONParser()
+                else:
+                    parser = FormParser()
+            parser.feed(chunk)
+        self.form = parser.close() if parser else {}
 
     def parse_qs(self):
         form = parse_qs(self.qs)
@@ -116,30 +519,147 @@ class HTTPRequest(object):
 
 class WebApp(object):
 
-    def __init__(self):
-        self.url_map = []
+    def __init__(self, keep_alive=False, max_connections=2, max_discard=1024, send_buffer_size=512, max_headers=32,
+                 max_header_line=512, max_body=1024, idle_timeout=10):
+        """
+        Set up the web app. If ``keep_alive`` is True, HTTP/1.1 clients can make several requests on the same
+        connection, for up to ``max_connections`` connections at a time (any more are closed after one request, to
+        keep memory use bounded). A kept-alive connection is closed if the next request doesn't start within
+        ``idle_timeout`` seconds, so that idle clients don't hold on to a connection. Unread request bodies of up to ``max_discard`` bytes are skipped so that the
+        connection can be reused. Files are sent ``send_buffer_size`` bytes at a time. Requests with more than
+        ``max_headers`` headers, or a header line longer than ``max_header_line`` bytes, are rejected with a 431, and
+        form bodies bigger than ``max_body`` bytes with a 413.
+
+        Routes can pass a tuple of header names as the ``headers`` argument, in which case only those headers are kept
+        in ``request.headers``. Otherwise ``headers`` can be 'parse' (keep them all), 'skip' or 'leave' (the handler
+        reads them itself).
+        """
+        self.keep_alive = keep_alive
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.max_discard = max_discard
+        self.connections = 0
+        self.max_headers = max_headers
+        self.max_header_line = max_header_line
+        self.max_body = max_body
+        self.connection_headers = compile_headers(())
+        # Files are sent through one buffer that is shared between requests. If another response is already using
+        # it, a temporary buffer is allocated instead.
+        self.send_buffer = bytearray(send_buffer_size)
+        self.send_buffer_busy = False
+        # Routes with a plain path are looked up by (method, path), with a method of None matching any method. Only
+        # routes with a regular expression need to be matched one by one.
+        self.static_routes = {}
+        self.pattern_routes = []
         self.templates_dir = '/templates'
+        # Compiled templates, see compile_template()
+        self.templates = {}
         self.static_dir = '/static'
-        self.url_map.append((re.compile('^/(static/.+)'), self.handle_static))
+        # How long browsers may cache static files for, if they are in the manifest
+        self.static_max_age = 7 * 24 * 3600
+        self.static_manifest = None
+        self.add_url_rule(re.compile('^/(static/.+)'), self.handle_static,
+                          headers=(b'Accept-Encoding', b'If-None-Match'))
         self.headers_mode = 'parse'
 
-    def parse_headers(self, reader):
+    def find_route(self, method, path):
+        """
+        Find the handler for a request. Returns a tuple of (handler, extra, url_match), or None if there is no route.
+        """
+        route = self.static_routes.get((method, path)) or self.static_routes.get((None, path))
+        if route:
+            return route[0], route[1], None
+        for pattern, handler, extra in self.pattern_routes:
+            if extra.get('method', method) != method:
+                continue
+            match = pattern.match(path)
+            if match:
+                return handler, extra, match
+        return None
+
+    def allowed_methods(self, path):
+        """
+        Return the methods that the path has routes for. Only used to tell a 405 from a 404.
+        """
+        methods = [method for method, url in self.static_routes if url == path]
+        for pattern, handler, extra in self.pattern_routes:
+            if pattern.match(path):
+                methods.append(extra.get('method'))
+        return methods
+
+    def read_headers(self, reader, wanted=None):
+        """
+        Read the request headers. If ``wanted`` is None all headers are kept, otherwise only the ones in ``wanted``
+        (see ``compile_headers``) are split up and stored, under the name they were declared with. Raises an HTTPError
+        if there are more than ``max_headers`` headers, or a header line is longer than ``max_header_line``.
+        """
         headers = {}
+        count = 0
         while True:
             line = yield from reader.readline()
-            if line == b'\r\n':
+            if line == b'\r\n' or not line:
                 break
-            key, value = line.split(b':', 1)
-            headers[key] = value.strip()
+            count += 1
+            if count > self.max_headers or len(line) > self.max_header_line:
+                raise HTTPError('431')
+            colon = line.find(b':')
+            if colon < 0:
+                continue
+            # Header names are case-insensitive, so they are matched in lower case
+            key = line[:colon]
+            lower_key = key.lower()
+            if wanted is None:
+                # The connection headers are stored under their usual names, so that they can be found
+                headers[self.connection_headers.get(lower_key, key)] = line[colon + 1:].strip()
+            elif lower_key in wanted:
+                headers[wanted[lower_key]] = line[colon + 1:].strip()
+        return headers
+
+    def parse_headers(self, reader):
+        headers = yield from self.read_headers(reader)
         return headers
 
     def handle(self, reader, writer):
+        response = writer
+        if self.keep_alive and self.connections < self.max_connections:
+            self.connections += 1
+            response = HTTPResponse(writer)
         close = True
         try:
-            request_line = yield from reader.readline()
+            idle = False
+            while True:
+                close = yield from self.handle_request(reader, response, idle)
+                if close is False or not getattr(response, 'keep_alive', False):
+                    break
+                idle = True
+        finally:
+            if response is not writer:
+                self.connections -= 1
+
+        if close is not False:
+            yield from writer.aclose()
+
+    def handle_request(self, reader, writer, idle=False):
+        """
+        Read a request from the connection and send the response. Returns False if the handler has taken over the
+        connection, in which case it should not be closed. If ``idle`` is True, the connection is waiting for the next
+        request after a previous one, and is dropped if it doesn't arrive within ``idle_timeout`` seconds.
+        """
+        keep_alive = isinstance(writer, HTTPResponse)
+        close = True
+        try:
+            if idle:
+                try:
+                    request_line = yield from asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    writer.keep_alive = False
+                    return close
+            else:
+                request_line = yield from reader.readline()
             if request_line == b'':
-                yield from writer.aclose()
-                return
+                if keep_alive:
+                    writer.keep_alive = False
+                return close
             req = HTTPRequest()
             request_line = request_line.decode()
             method, path, proto = request_line.split()
@@ -149,92 +669,184 @@ class WebApp(object):
                 qs = path[1]
             path = path[0]
 
-            found = False
-            for e in self.url_map:
-                pattern = e[0]
-                handler = e[1]
-                extra = {}
-                if len(e) > 2:
-                    extra = e[2]
-
-                if path == pattern:
-                    if extra and extra.get('method'):
-                        if extra['method'] == method:
-                            found = True
-                            break
-                    else:
-                        found = True
-                        break
-                elif not isinstance(pattern, str):
-                    m = pattern.match(path)
-                    if m:
-                        req.url_match = m
-                        if extra and extra.get('method'):
-                            if extra['method'] == method:
-                                found = True
-                                break
-                        else:
-                            found = True
-                            break
-
-            if not found:
+            route = self.find_route(method, path)
+            wanted = None
+            if not route:
                 headers_mode = 'skip'
             else:
+                handler, extra, req.url_match = route
                 headers_mode = extra.get('headers', self.headers_mode)
+                wanted = extra.get('wanted_headers')
 
+            headers = None
             if headers_mode == 'skip':
-                while True:
-                    line = yield from reader.readline()
-                    if line == b'\r\n':
-                        break
+                headers = req.headers = yield from self.read_headers(reader, self.connection_headers)
             elif headers_mode == 'parse':
-                req.headers = yield from self.parse_headers(reader)
+                headers = req.headers = yield from self.read_headers(reader)
+            elif wanted is not None:
+                headers = req.headers = yield from self.read_headers(reader, wanted)
             else:
                 assert headers_mode == 'leave'
 
-            if found:
+            if keep_alive:
+                # The connection can only be reused if the client asked for it and the headers have been read
+                writer.keep_alive = (headers is not None and proto == 'HTTP/1.1' and
+                                     headers.get(b'Connection', b'').lower() != b'close')
+                req.body_size = int(headers.get(b'Content-Length', 0)) if headers else 0
+
+            if route:
                 req.method = method
                 req.path = path
                 req.qs = qs
                 req.reader = reader
+                req.max_body = self.max_body
                 close = yield from handler(req, writer)
             else:
-                yield from self.abort(writer, '404')
+                methods = self.allowed_methods(path)
+                if methods:
+                    yield from self.abort(writer, '405', {'Allow': ', '.join(methods)})
+                else:
+                    yield from self.abort(writer, '404')
+
+            if keep_alive:
+                yield from writer.finish()
+                if req.body_size:
+                    # Skip over the body if the handler didn't read it, so that the next request can be read
+                    if req.body_size > self.max_discard:
+                        writer.keep_alive = False
+                    while writer.keep_alive and req.body_size > 0:
+                        data = yield from reader.read(req.body_size)
+                        if not data:
+                            writer.keep_alive = False
+                        req.body_size -= len(data)
+        except HTTPError as e:
+            if keep_alive:
+                writer.keep_alive = False
+            yield from self.abort(writer, e.status)
         except Exception:
-            pass
-
-        if close is not False:
-            yield from writer.aclose()
+            if keep_alive:
+                writer.keep_alive = False
+        return close
 
-    def abort(self, writer, status):
-        yield from start_response(writer, status=status)
+    def abort(self, writer, status, headers=None):
+        yield from start_response(writer, status=status, headers=add_content_length(headers, len(status) + 2))
         yield from writer.awrite(status + '\r\n')
 
     def route(self, url, **kwargs):
         def _route(f):
-            self.url_map.append((url, f, kwargs))
+            self.add_url_rule(url, f, **kwargs)
             return f
         return _route
 
     def add_url_rule(self, url, func, **kwargs):
-        self.url_map.append((url, func, kwargs))
+        if isinstance(kwargs.get('headers'), (tuple, list)):
+            kwargs['wanted_headers'] = compile_headers(kwargs['headers'])
+        if isinstance(url, str):
+            self.static_routes[(kwargs.get('method'), url)] = (func, kwargs)
+        else:
+            self.pattern_routes.append((url, func, kwargs))
 
     def sendfile(self, writer, fname, content_type=None, headers=None):
         if not content_type:
             content_type = get_mime_type(fname)
         try:
-            with open(fname) as f:
+            with open(fname, 'rb') as f:
+                headers = add_content_length(headers, os.stat(fname)[6])
                 yield from start_response(writer, content_type, '200', headers)
-                yield from sendstream(writer, f)
+                if self.send_buffer_busy:
+                    yield from sendstream(writer, f, bytearray(len(self.send_buffer)))
+                else:
+                    self.send_buffer_busy = True
+                    try:
+                        yield from sendstream(writer, f, self.send_buffer)
+                    finally:
+                        self.send_buffer_busy = False
         except OSError as e:
             if e.args[0] == errno.ENOENT:
                 yield from http_error(writer, '404')
             else:
                 raise
 
+    def render_template(self, writer, name, context, content_type='text/html'):
+        """
+        Send a template from ``templates_dir``, with each ``{{ name }}`` placeholder replaced by ``context[name]``. The
+        template is only scanned for placeholders the first time, and then the literal text is streamed straight from
+        the file. Values are HTML-escaped, unless they are callables, in which case they are called with the writer
+        and should write the value themselves, e.g. to stream it or to write HTML.
+        """
+        fname = self.templates_dir + '/' + name
+        segments = self.templates.get(fname)
+        if segments is None:
+            segments = self.templates[fname] = compile_template(fname)
+        yield from start_response(writer, content_type)
+        if self.send_buffer_busy:
+            buf = bytearray(len(self.send_buffer))
+        else:
+            buf = self.send_buffer
+            self.send_buffer_busy = True
+        view = memoryview(buf)
+        try:
+            with open(fname, 'rb') as f:
+                for segment in segments:
+                    if isinstance(segment, str):
+                        value = context.get(segment, '')
+                        if callable(value):
+                            yield from value(writer)
+                        elif value is not None:
+                            yield from writer.awrite(escape_html(str(value)))
+                        continue
+                    offset, length = segment
+                    f.seek(offset)
+                    while length > 0:
+                        size = f.readinto(view[:min(length, len(buf))])
+                        if not size:
+                            break
+                        yield from writer.awrite(view[:size])
+                        length -= size
+        finally:
+            if buf is self.send_buffer:
+                self.send_buffer_busy = False
+
+    def load_static_manifest(self):
+        """
+        Load the manifest written by tools/compress_static.py, which has the ETag and size of each static file and of
+        its gzipped copy, if it has one
+        """
+        if self.static_manifest is None:
+            try:
+                with open(self.static_dir + '/manifest.json') as f:
+                    self.static_manifest = json.load(f)
+            except (OSError, ValueError):
+                self.static_manifest = {}
+        return self.static_manifest
+
     def handle_static(self, req, resp):
         fpath = req.url_match.group(1)
         if '..' in fpath:
             yield from http_error(resp, '403')
             return
-        yield from self.sendfile(resp, fpath)
+        entry = self.load_static_manifest().get(fpath.split('/', 1)[-1])
+        if not entry:
+            yield from self.sendfile(resp, fpath)
+            return
+        # The gzipped copy has its own ETag and size, as a strong ETag must be different for each content coding
+        request_headers = getattr(req, 'headers', {})
+        variant = entry
+        if entry.get('gzip') and b'gzip' in request_headers.get(b'Accept-Encoding', b''):
+            variant = entry['gzip']
+        etag = '"%s"' % variant['etag']
+        headers = {
+            'ETag': etag,
+            'Cache-Control': 'max-age=%d' % self.static_max_age,
+            'Vary': 'Accept-Encoding'
+        }
+        if request_headers.get(b'If-None-Match') == etag.encode():
+            # The browser already has this file, so there's no need to open it
+            headers['Content-Length'] = str(variant['size'])
+            yield from start_response(resp, get_mime_type(fpath), '304', headers)
+            return
+        if variant is not entry:
+            headers['Content-Encoding'] = 'gzip'
+            yield from self.sendfile(resp, fpath + '.gz', get_mime_type(fpath), headers)
+        else:
+            yield from self.sendfile(resp, fpath, headers=headers)